@@ -1,10 +1,20 @@
 import os
 import re
+import json
 import time
+import queue
+import atexit
+import logging
+import sqlite3
+import threading
+from logging.handlers import QueueHandler, QueueListener
 import requests
 import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
 from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 from urllib.parse import quote, urlencode
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
@@ -12,8 +22,35 @@ from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-
+from selenium.common.exceptions import TimeoutException
+
+# Prefer the C-backed lxml parser; fall back to the stdlib parser if it isn't installed
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# --- Logging: workers only enqueue records; one background thread formats and writes them ---
+log = logging.getLogger("gtr")
+log.setLevel(os.environ.get("GTR_LOG_LEVEL", "INFO").upper())
+log.propagate = False
+_log_queue = queue.SimpleQueue()
+log.addHandler(QueueHandler(_log_queue))
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(message)s"))
+_log_listener = QueueListener(_log_queue, _log_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+# Local cache of scraped project pages (Project ID → people + funded value)
+CACHE_DB = "gtr_cache.db"
+CACHE_TTL = 7 * 24 * 3600  # seconds
+
+# Regexes used per page / per search, compiled once
+_RX_SUPERVISOR = re.compile(r"supervisor[^<]*<[^>]*>([^<]+)</a>", re.I)
+_RX_STUDENT = re.compile(r"student[^<]*<[^>]*>([^<]+)</a>", re.I)
+_RX_SAFE_TERM = re.compile(r"[^A-Za-z0-9_]+")
 
 # ---------- Utilities ----------
 
@@ -26,13 +63,166 @@ def load_classification_label():
         return default
 
 
+# Analytics / tracking hosts that add nothing to the extracted fields
+BLOCKED_URLS = [
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*fonts.googleapis.com*",
+    "*fonts.gstatic.com*",
+]
+
+
 def setup_driver():
     opts = Options()
     opts.add_argument("--headless=new")
     opts.add_argument("--disable-gpu")
     opts.add_argument("--no-sandbox")
     opts.add_argument("--disable-dev-shm-usage")
-    return webdriver.Chrome(options=opts)
+    # Skip images / CSS / fonts and return at DOMContentLoaded
+    opts.add_argument("--blink-settings=imagesEnabled=false")
+    opts.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.managed_default_content_settings.stylesheets": 2,
+        "profile.managed_default_content_settings.fonts": 2,
+    })
+    opts.page_load_strategy = "eager"
+    driver = webdriver.Chrome(options=opts)
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
+    return driver
+
+
+class DriverPool:
+    """
+    Long-lived pool of Chrome drivers shared by all workers.
+    Drivers are started lazily (at most `size` of them), handed back after each
+    page instead of being quit, and recycled after `recycle_after` page loads
+    to keep Chrome's memory growth in check. Use as a context manager and pass
+    the same pool to several searches to pay Chrome start-up only once.
+    """
+
+    def __init__(self, size=4, recycle_after=50):
+        self.size = size
+        self.recycle_after = recycle_after
+        self._idle = queue.Queue()
+        self._uses = {}
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def acquire(self):
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                break
+            # Pool is full: wait for a driver to come back (or a recycled slot to free up)
+            try:
+                return self._idle.get(timeout=1)
+            except queue.Empty:
+                continue
+        try:
+            driver = setup_driver()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        self._uses[id(driver)] = 0
+        return driver
+
+    def release(self, driver, broken=False):
+        if broken:
+            # Crashed/hung drivers are never handed out again
+            self._retire(driver)
+            return
+        self._uses[id(driver)] += 1
+        if self._uses[id(driver)] < self.recycle_after:
+            self._idle.put(driver)
+            return
+        # Recycle: quit this one and let the next acquire() start a fresh driver
+        self._retire(driver)
+
+    def _retire(self, driver):
+        self._uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def close(self):
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._retire(driver)
+
+
+def open_cache(path=CACHE_DB):
+    """Open (creating if needed) the SQLite project cache; safe to share across worker threads."""
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS projects ("
+        "pid TEXT PRIMARY KEY, pis TEXT, cois TEXT, funded_value TEXT, fetched_at INTEGER)"
+    )
+    return conn
+
+
+_cache_lock = threading.Lock()
+
+
+def cache_get(conn, pid, ttl=CACHE_TTL):
+    """Return (pis, cois, funded_value) for a fresh cached project, else None."""
+    with _cache_lock:
+        row = conn.execute(
+            "SELECT pis, cois, funded_value FROM projects WHERE pid = ? AND fetched_at > ?",
+            (pid, int(time.time()) - ttl),
+        ).fetchone()
+    if not row:
+        return None
+    return json.loads(row[0]), json.loads(row[1]), row[2]
+
+
+def cache_put(conn, pid, pis, cois, funded_value):
+    with _cache_lock:
+        conn.execute(
+            "INSERT OR REPLACE INTO projects (pid, pis, cois, funded_value, fetched_at) VALUES (?, ?, ?, ?, ?)",
+            (pid, json.dumps(list(pis)), json.dumps(list(cois)), funded_value or "", int(time.time())),
+        )
+
+
+def build_session(pool_size=4):
+    """
+    Shared requests session; pool sized so every worker thread keeps its own
+    keep-alive connection. Transient GtR errors (429 / 5xx) are retried with
+    exponential backoff instead of aborting the run.
+    """
+    session = requests.Session()
+    retries = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=["GET"])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
+
+
+# Module-level session for GtR API calls, so the TLS handshake is paid once per process
+API_SESSION = build_session(pool_size=8)
 
 
 def build_gtr_project_url(ref: str) -> str:
@@ -45,22 +235,20 @@ def build_gtr_project_url(ref: str) -> str:
     encoded = quote(ref, safe="")
     return f"https://gtr.ukri.org/projects?ref={encoded}"
 
-def fetch_all_hits_gtr(query, max_records=500, title_only = True):
+def fetch_all_hits_gtr(query, max_records=500, title_only = True, max_workers=8, session=API_SESSION):
     """
     Fetches records from the GTR API using a keyword search query.
     Corrected version: uses `project.query` param, proper pagination, and version headers.
+    Page 1 is fetched first to learn `totalPages`; the remaining pages are fetched concurrently.
     """
     base_url = "https://gtr.ukri.org/gtr/api/projects"
     headers = {"Accept": "application/vnd.rcuk.gtr.json-v7"}
-    records = []
-    page = 1
     fetch_size = 100
     fields = 'project.title' if title_only else 'project.title,project.abs'
-    # Build and log the full request URL for transparency
 
-    print(f"🔍 Querying GTR for '{query}' (fields={fields}) …")
+    log.info("🔍 Querying GTR for '%s' (fields=%s) …", query, fields)
 
-    while len(records) < max_records:
+    def fetch_page(page):
         params = {
             "project.query": query,   # Correct param name
             "page": page,             # Page number
@@ -69,136 +257,232 @@ def fetch_all_hits_gtr(query, max_records=500, title_only = True):
         }
         # Build and log the full request URL for transparency
         full_url = f"{base_url}?{urlencode(params)}"
-        print(f"🌐 Requesting: {full_url}")
-
+        log.debug("🌐 Requesting: %s", full_url)
 
-        resp = requests.get(base_url, params=params, headers=headers, timeout=20)
+        resp = session.get(base_url, params=params, headers=headers, timeout=20)
         if resp.status_code == 400:
             raise ValueError(f"GTR API rejected the query '{query}' – check parameter format.")
         resp.raise_for_status()
+        return resp.json()
+
+    first = fetch_page(1)
+    pages = {1: first.get("project", [])}
+    log.info("📄 Page 1 → got %s records", len(pages[1]))
+
+    total_pages = first.get("totalPages") or 1
+    last_page = min(total_pages, -(-max_records // fetch_size))
+    if pages[1] and last_page > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            futs = {ex.submit(fetch_page, page): page for page in range(2, last_page + 1)}
+            for fut in as_completed(futs):
+                page = futs[fut]
+                pages[page] = fut.result().get("project", [])
+                log.info("📄 Page %s → got %s records", page, len(pages[page]))
+
+    # Merge in page order
+    records = [item for page in sorted(pages) for item in pages[page]]
+    return records[:max_records]
 
-        data = resp.json()
-        items = data.get("project", [])
-        if not items:
-            break
-
-        records.extend(items)
-        print(f"📄 Page {page} → got {len(items)} records")
-        page += 1
-        if len(items) < fetch_size:
-            break
+# Runs in the page and mirrors the sidebar / People tab / Funded Value parsing
+# below, so the Selenium fallback needs one round trip instead of page_source
+EXTRACT_PROJECT_JS = """
+const clean = s => (s || "").replace(/\\s+/g, " ").trim();
+const pis = [], cois = [];
+const add = (list, name) => { if (name && !list.includes(name)) list.push(name); };
+document.querySelectorAll(".aside-category").forEach(aside => {
+    const h3 = aside.querySelector("h3"), a = aside.querySelector("a");
+    if (!h3 || !a) return;
+    const header = clean(h3.textContent).toLowerCase(), name = clean(a.textContent);
+    if (header.includes("principal investigator") || header.includes("supervisor")) add(pis, name);
+    else if (header.includes("student") || header.includes("co-investigator")) add(cois, name);
+});
+const tab = document.querySelector("#tabPeople");
+if (tab) tab.querySelectorAll("a[href*='/person/']").forEach(a => {
+    const text = clean(a.textContent);
+    if (!text) return;
+    const lower = text.toLowerCase(), name = text.split("(")[0].trim();
+    if (lower.includes("principal investigator") || lower.includes("supervisor")) add(pis, name);
+    else add(cois, name);
+});
+let fundedValue = "";
+const fv = Array.from(document.querySelectorAll("h3")).find(h => h.textContent.includes("Funded Value"));
+if (fv) {
+    const strong = document.evaluate("following::strong[1]", fv, null,
+        XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    if (strong) fundedValue = clean(strong.textContent);
+}
+const title = document.querySelector("h1#gtr-project-title");
+return {title: title ? clean(title.textContent) : "", pis, cois, fundedValue, hasPeopleTab: !!tab};
+"""
 
-    return records[:max_records]
 
-def scrape_project_page(driver, project_url, funded_value=None):
+def render_project_data(driver, project_url):
     """
-    Visit a GtR project page and extract PI / Co-I / Supervisor / Student names.
-    If funded_value was not provided by API, scrape it from the page sidebar.
+    Selenium fallback: load the page in Chrome and extract everything with one
+    execute_script call. The full page_source is only pulled (as "html") when
+    no people were found, for the regex fallback.
     """
-
-    # --- Normalize URL ---
-    if project_url.startswith("/"):
-        project_url = "https://gtr.ukri.org" + project_url
-    if not project_url.startswith("http"):
-        project_url = "https://gtr.ukri.org/" + project_url.lstrip("/")
-
-    print(f"\n🔗 Visiting: {project_url}")
-
-    # --- Load the page ---
+    driver.get(project_url)
+    # Return as soon as any extractable block is present; pages without them
+    # fall through to the regex fallback instead of waiting out the timeout
     try:
-        driver.get(project_url)
-        WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
+        WebDriverWait(driver, 10, poll_frequency=0.1).until(
+            lambda d: d.find_elements(By.CSS_SELECTOR, "#tabPeople, .aside-category, #gtr-project-title")
         )
-        time.sleep(1.2)
-    except Exception as e:
-        print(f"❌ Error loading {project_url}: {e}")
-        return [], [], funded_value or ""
+    except TimeoutException:
+        pass
+    data = driver.execute_script(EXTRACT_PROJECT_JS)
+    data["html"] = "" if (data["pis"] or data["cois"]) else driver.page_source
+    return data
 
-    html = driver.page_source
-    soup = BeautifulSoup(html, "html.parser")
 
-    pis, cois = set(), set()
+def parse_project_tree(tree):
+    """Extract (title, pis, cois, funded_value) from a parsed GtR project page."""
+    pis, cois = {}, {}  # dicts as insertion-ordered sets
 
-    # --- Page sanity check ---
-    title_tag = soup.find("h1", {"id": "gtr-project-title"})
-    if title_tag:
-        print(f"📘 Page Title: {title_tag.get_text(strip=True)}")
-    else:
-        print("⚠️ No title found — page may not have loaded correctly")
+    title_tag = tree.css_first("h1#gtr-project-title")
+    title = title_tag.text(strip=True) if title_tag else ""
 
     # --- 1️⃣ Sidebar parsing ---
-    for aside in soup.select(".aside-category"):
-        h3 = aside.find("h3")
+    for aside in tree.css(".aside-category"):
+        h3 = aside.css_first("h3")
         if not h3:
             continue
-        header = h3.get_text(strip=True).lower()
-        name_tag = aside.find("a")
+        header = h3.text(strip=True).lower()
+        name_tag = aside.css_first("a")
         if not name_tag:
             continue
-        name = name_tag.get_text(strip=True)
+        name = name_tag.text(strip=True)
 
         if "principal investigator" in header or "supervisor" in header:
-            pis.add(name)
-            print(f"✅ Sidebar: Found PI/Supervisor: {name}")
+            pis[name] = None
+            log.debug("✅ Sidebar: Found PI/Supervisor: %s", name)
         elif "student" in header or "co-investigator" in header:
-            cois.add(name)
-            print(f"✅ Sidebar: Found Co-I/Student: {name}")
+            cois[name] = None
+            log.debug("✅ Sidebar: Found Co-I/Student: %s", name)
 
     # --- 2️⃣ People tab parsing ---
-    people_tab = soup.select_one("#tabPeople")
+    people_tab = tree.css_first("#tabPeople")
     if people_tab:
-        print("🔍 Found People tab — parsing people links...")
-        for a in people_tab.select("a[href*='/person/']"):
-            text = a.get_text(" ", strip=True)
+        log.debug("🔍 Found People tab — parsing people links...")
+        for a in people_tab.css("a[href*='/person/']"):
+            text = a.text(separator=" ", strip=True)
             if not text:
                 continue
             lower = text.lower()
             name = text.split("(")[0].strip()
 
             if "principal investigator" in lower or "supervisor" in lower:
-                pis.add(name)
-                print(f"✅ People tab: Found PI/Supervisor: {name}")
+                pis[name] = None
+                log.debug("✅ People tab: Found PI/Supervisor: %s", name)
             elif "co-investigator" in lower or "student" in lower:
-                cois.add(name)
-                print(f"✅ People tab: Found Co-I/Student: {name}")
+                cois[name] = None
+                log.debug("✅ People tab: Found Co-I/Student: %s", name)
             else:
                 # fallback
-                print(f"⚙️ People tab: Found unlabelled '{name}', defaulting to Co-I")
-                cois.add(name)
+                log.debug("⚙️ People tab: Found unlabelled '%s', defaulting to Co-I", name)
+                cois[name] = None
     else:
-        print("⚠️ No People tab found")
+        log.debug("⚠️ No People tab found")
 
-    # --- 3️⃣ Regex fallback for rare HTMLs ---
-    if not pis and "supervisor" in html.lower():
-        for m in re.findall(r"supervisor[^<]*<[^>]*>([^<]+)</a>", html, flags=re.I):
-            pis.add(m.strip())
-            print(f"🔁 Regex Supervisor: {m.strip()}")
+    # --- 3️⃣ Funded value ---
+    funded_value = ""
+    try:
+        # css() returns nodes in document order, so the first <strong> after
+        # the "Funded Value" <h3> is the equivalent of bs4's find_next("strong")
+        seen_header = False
+        for node in tree.css("h3, strong"):
+            if node.tag == "h3":
+                seen_header = seen_header or "Funded Value" in node.text()
+            elif seen_header:
+                funded_value = node.text(strip=True)
+                break
+    except Exception as e:
+        log.warning("⚠️ Could not scrape funded value: %s", e)
 
-    if not cois and "student" in html.lower():
-        for m in re.findall(r"student[^<]*<[^>]*>([^<]+)</a>", html, flags=re.I):
-            cois.add(m.strip())
-            print(f"🔁 Regex Student: {m.strip()}")
+    return title, pis, cois, funded_value
+
+
+def scrape_project_page(session, project_url, funded_value=None, driver_pool=None):
+    """
+    Fetch a GtR project page and extract PI / Co-I / Supervisor / Student names.
+    If funded_value was not provided by API, scrape it from the page sidebar.
+
+    GtR project pages are server-rendered, so they are fetched with a plain GET.
+    Selenium is only used (with a driver borrowed from `driver_pool`) when the
+    static HTML comes back without a project title.
+    """
+
+    # --- Normalize URL ---
+    if project_url.startswith("/"):
+        project_url = "https://gtr.ukri.org" + project_url
+    if not project_url.startswith("http"):
+        project_url = "https://gtr.ukri.org/" + project_url.lstrip("/")
+
+    log.debug("🔗 Visiting: %s", project_url)
 
-    # --- 4️⃣ Scrape funded value (only if missing) ---
-    if not funded_value:
+    # --- Load the page ---
+    try:
+        resp = session.get(project_url, timeout=20)
+        resp.raise_for_status()
+        html = resp.text
+    except Exception as e:
+        log.error("❌ Error loading %s: %s", project_url, e)
+        html = ""
+
+    tree = LexborHTMLParser(html)
+
+    if tree.css_first("h1#gtr-project-title") or driver_pool is None:
+        title, pis, cois, page_value = parse_project_tree(tree)
+    else:
+        # --- Selenium fallback for pages that need JS ---
+        log.warning("⚠️ No title in static HTML — retrying with Selenium")
         try:
-            fv_header = soup.find("h3", string=lambda s: s and "Funded Value" in s)
-            if fv_header:
-                fv_tag = fv_header.find_next("strong")
-                if fv_tag:
-                    funded_value = fv_tag.get_text(strip=True)
-                    print(f"💰 Scraped Funded Value: {funded_value}")
+            driver = driver_pool.acquire()
+            try:
+                data = render_project_data(driver, project_url)
+            except Exception:
+                driver_pool.release(driver, broken=True)
+                raise
+            driver_pool.release(driver)
         except Exception as e:
-            print(f"⚠️ Could not scrape funded value: {e}")
+            log.error("❌ Error loading %s: %s", project_url, e)
+            return [], [], funded_value or ""
+        title, page_value, html = data["title"], data["fundedValue"], data["html"]
+        pis, cois = dict.fromkeys(data["pis"]), dict.fromkeys(data["cois"])
+        log.debug("✅ Selenium: Found %s PI/Supervisor(s), %s Co-I/Student(s)", len(pis), len(cois))
+        if not data["hasPeopleTab"]:
+            log.debug("⚠️ No People tab found")
+
+    # --- Page sanity check ---
+    if title:
+        log.debug("📘 Page Title: %s", title)
+    else:
+        log.warning("⚠️ No title found — page may not have loaded correctly")
+
+    # --- 4️⃣ Regex fallback for rare HTMLs ---
+    if not pis and "supervisor" in html.lower():
+        for m in _RX_SUPERVISOR.findall(html):
+            pis[m.strip()] = None
+            log.debug("🔁 Regex Supervisor: %s", m.strip())
+
+    if not cois and "student" in html.lower():
+        for m in _RX_STUDENT.findall(html):
+            cois[m.strip()] = None
+            log.debug("🔁 Regex Student: %s", m.strip())
+
+    # --- 5️⃣ Use scraped funded value (only if missing) ---
+    if not funded_value and page_value:
+        funded_value = page_value
+        log.debug("💰 Scraped Funded Value: %s", funded_value)
 
     # --- Summary ---
     if not pis and not cois:
-        print("⚠️ No investigators, supervisors, or students found.")
+        log.warning("⚠️ No investigators, supervisors, or students found.")
     else:
-        print(f"👤 PIs/Supervisors: {len(pis)} | Co-Is/Students: {len(cois)} | 💰 Value: {funded_value or 'N/A'}")
+        log.debug("👤 PIs/Supervisors: %s | Co-Is/Students: %s | 💰 Value: %s", len(pis), len(cois), funded_value or 'N/A')
 
-    return sorted(pis), sorted(cois), funded_value or ""
+    return list(pis), list(cois), funded_value or ""
 # def scrape_project_page(driver, project_url):
 #     """
 #     Visit a GtR project page and extract PI / Co-I / Supervisor / Student names.
@@ -298,122 +582,166 @@ def scrape_project_page(driver, project_url, funded_value=None):
 #     return sorted(pis), sorted(cois)
 
 
-def scrape_gtr_batch(batch, wid):
-    driver = setup_driver()
-    results = []
-    for i, row in enumerate(batch, start=1):
-        pid = row["Project ID"]
-        url = row["Project URL"]
-        print(f"🧵 Worker {wid}: [{i}/{len(batch)}] Scraping {pid}")
+def _format_pounds(values):
+    """Format a column of amounts as '£12,345'; non-numeric values pass through as strings."""
+    nums = pd.to_numeric(values, errors="coerce")
+    out = pd.Series(None, index=values.index, dtype=object)
+    ok = nums.notna() & (nums != 0)
+    out[ok] = nums[ok].astype("int64").map("£{:,}".format)
+    raw = nums.isna() & values.notna() & (values.astype(str) != "")
+    out[raw] = values[raw].astype(str)
+    return out
+
+
+def _lead_participant_value(participants):
+    """Funded value from the lead participant's offer (EU / Horizon records)."""
+    if isinstance(participants, dict):
+        participants = [participants]
+    for part in participants if isinstance(participants, list) else []:
+        if part.get("role", "").upper() in ("LEAD_PARTICIPANT", "LEAD"):
+            offer = part.get("grantOffer") or part.get("projectCost")
+            if offer:
+                try:
+                    return f"£{int(round(offer)):,}"
+                except Exception:
+                    return str(offer)
+    return None
+
+
+def _rcuk_ref(project):
+    """RCUK grant reference from a record's identifiers (dict- or list-shaped), else None."""
+    idents = project.get("identifiers") or project.get("identifier") or {}
+    id_list = idents.get("identifier", []) if isinstance(idents, dict) else idents
+    for ident in id_list if isinstance(id_list, list) else [id_list]:
+        if isinstance(ident, dict) and ident.get("type") == "RCUK":
+            return ident.get("value") or None
+    return None
+
+
+def simplify_gtr_projects(all_projects):
+    """Flatten GtR API project records into the spreadsheet columns with one json_normalize pass."""
+    needed = ["id", "title", "status", "grantCategory", "leadFunder", "fund.start", "fund.end",
+              "fund.amountPounds", "fund.fundedValue"]
+    # Only flatten one level: deeper fields (participants, identifiers) come as a dict or
+    # a list depending on the record, so they're pulled out per record below instead
+    df = pd.json_normalize(all_projects, max_level=1)
+    df = df.reindex(columns=df.columns.union(needed, sort=False))
+
+    # --- Funded Value: fund block first (common for UKRI) ---
+    funded = _format_pounds(df["fund.amountPounds"])
+    funded = funded.where(funded.notna(), _format_pounds(df["fund.fundedValue"]))
+    # --- Fallback: participantValues (common for EU or Horizon records) ---
+    participants = pd.Series(
+        [(p.get("participantValues") or {}).get("participant")
+         if isinstance(p.get("participantValues"), dict) else None for p in all_projects],
+        index=df.index, dtype=object,
+    )
+    missing = funded.isna() & participants.notna()
+    if missing.any():
+        funded[missing] = participants[missing].map(_lead_participant_value)
+
+    # --- Build correct project URL from the RCUK grant reference ---
+    ref = pd.Series([_rcuk_ref(p) for p in all_projects], index=df.index, dtype=object)
+    ids = df["id"].fillna("").astype(str)
+    url = ("https://gtr.ukri.org/projects?ref=" + ref.dropna().map(lambda r: quote(r, safe=""))).reindex(df.index)
+    url = url.fillna("https://gtr.ukri.org/projects/" + ids.map(quote))
+
+    return pd.DataFrame({
+        "Project ID": df["id"],
+        "Title": df["title"].fillna(""),
+        "Status": df["status"].fillna(""),
+        "Start Date": df["fund.start"].fillna(""),
+        "End Date": df["fund.end"].fillna(""),
+        "Funder": df["leadFunder"].fillna(""),
+        "Project Category": df["grantCategory"].fillna(""),
+        "Funded Value": funded.fillna(""),
+        "Project URL": url,
+    })
+
+
+def scrape_gtr_project(row, session, driver_pool, cache=None, progress=""):
+    """Scrape (or fetch from cache) one project row and return it with the people columns added."""
+    pid = row["Project ID"]
+    url = row["Project URL"]
+    cached = cache_get(cache, pid) if cache is not None else None
+    if cached:
+        log.info("🧵 %s Cached %s", progress, pid)
+        pis, cois, cached_value = cached
+        funded_value = row.get("Funded Value") or cached_value
+    else:
+        log.info("🧵 %s Scraping %s", progress, pid)
         try:
-            pis, cois, funded_value = scrape_project_page(driver, url, funded_value=row.get("Funded Value"))
+            pis, cois, funded_value = scrape_project_page(
+                session, url, funded_value=row.get("Funded Value"), driver_pool=driver_pool
+            )
+            # Only cache pages that yielded people, so failed loads get retried next run
+            if cache is not None and (pis or cois):
+                cache_put(cache, pid, pis, cois, funded_value)
 
         except Exception as e:
-            print(f"⚠️ Worker {wid} error {pid}: {e}")
-            pis, cois = [], []
-        results.append({
-            **row,
-            "Chief Investigators": "; ".join(pis),
-            "No. of PIs": len(pis),
-            "Co-Investigators": "; ".join(cois),
-            "No. of Co-Is": len(cois),
-            "Funded Value": funded_value
-        })
-    driver.quit()
-    return results
+            log.warning("⚠️ Error %s: %s", pid, e)
+            pis, cois, funded_value = [], [], row.get("Funded Value") or ""
+    return {
+        **row,
+        "Chief Investigators": "; ".join(pis),
+        "No. of PIs": len(pis),
+        "Co-Investigators": "; ".join(cois),
+        "No. of Co-Is": len(cois),
+        "Funded Value": funded_value
+    }
+
+
+def column_widths(df):
+    """Autosize widths (longest cell or header + 2), computed column-wise in pandas."""
+    if df.empty:
+        return [len(str(c)) + 2 for c in df.columns]
+    cell_lens = df.astype(str).apply(lambda s: s.str.len().max())
+    header_lens = pd.Series([len(str(c)) for c in df.columns], index=df.columns)
+    return (cell_lens.combine(header_lens, max) + 2).astype(int).tolist()
 
 
-def run_gtr_search_to_excel(search_term, max_records=200, threads=4):
-    print(f"🔍 Querying GTR for '{search_term}' …")
+def write_sheet(writer, sheet_name, df):
+    """
+    Write `df` to a new sheet row by row. constant_memory mode only accepts
+    rows in order, and DataFrame.to_excel writes column by column.
+    """
+    ws = writer.book.add_worksheet(sheet_name)
+    header_fmt = writer.book.add_format({"bold": True, "border": 1})
+    ws.write_row(0, 0, [str(c) for c in df.columns], header_fmt)
+    values = df.astype(object).where(df.notna(), "")
+    for r, row in enumerate(values.itertuples(index=False), start=1):
+        ws.write_row(r, 0, row)
+    return ws
+
+
+def run_gtr_search_to_excel(search_term, max_records=200, threads=16, driver_pool=None, use_cache=True):
+    log.info("🔍 Querying GTR for '%s' …", search_term)
     all_projects = fetch_all_hits_gtr(search_term, max_records=max_records)
-    print(f"📦 Got {len(all_projects)} records from GTR")
-
-    simplified = []
-    for p in all_projects:
-        pid = p.get("id")
-        title = p.get("title", "")
-        status = p.get("status", "")
-        category = p.get("grantCategory", "")
-        funder = p.get("leadFunder", "")
-
-        # --- Funded Value extraction ---
-        funded_value = ""
-        start = end = ""
-
-        # (A) Try from fund block (common for UKRI)
-        fund = p.get("fund", {}) or {}
-        if fund:
-            start = fund.get("start", "") or ""
-            end = fund.get("end", "") or ""
-            if fund.get("amountPounds"):
-                try:
-                    funded_value = f"£{int(fund['amountPounds']):,}"
-                except Exception:
-                    funded_value = str(fund["amountPounds"])
-            elif fund.get("fundedValue"):
-                try:
-                    funded_value = f"£{int(fund['fundedValue']):,}"
-                except Exception:
-                    funded_value = str(fund["fundedValue"])
-
-        # (B) Fallback: participantValues (common for EU or Horizon records)
-        if not funded_value:
-            pv = p.get("participantValues")
-            if isinstance(pv, dict) and pv.get("participant"):
-                participants = pv["participant"]
-                if isinstance(participants, dict):
-                    participants = [participants]
-                for part in participants:
-                    if part.get("role", "").upper() in (
-                    "LEAD_PARTICIPANT", "LEAD"):
-                        offer = part.get("grantOffer") or part.get(
-                            "projectCost")
-                        if offer:
-                            try:
-                                funded_value = f"£{int(round(offer)):,}"
-                            except Exception:
-                                funded_value = str(offer)
-                            break
-
-        # --- Build correct project URL ---
-        ref = None
-        idents = p.get("identifiers") or p.get("identifier") or {}
-        id_list = idents.get("identifier", []) if isinstance(idents,
-                                                             dict) else idents
-        for ident in id_list:
-            if ident.get("type") == "RCUK":
-                ref = ident.get("value")
-                break
+    log.info("📦 Got %s records from GTR", len(all_projects))
 
-        if ref:
-            url = f"https://gtr.ukri.org/projects?ref={quote(ref, safe='')}"
-        else:
-            url = f"https://gtr.ukri.org/projects/{quote(pid)}"
-
-        simplified.append({
-            "Project ID": pid,
-            "Title": title,
-            "Status": status,
-            "Start Date": start,
-            "End Date": end,
-            "Funder": funder,
-            "Project Category": category,
-            "Funded Value": funded_value,
-            "Project URL": url
-        })
-
-    # Split work among threads
-    chunk_size = max(1, len(simplified) // threads)
-    chunks = [simplified[i:i + chunk_size] for i in range(0, len(simplified), chunk_size)]
+    simplified = simplify_gtr_projects(all_projects).to_dict("records")
 
-    results = []
-    with ThreadPoolExecutor(max_workers=threads) as ex:
-        futs = {ex.submit(scrape_gtr_batch, chunk, wid): wid for wid, chunk in enumerate(chunks, 1)}
-        for fut in as_completed(futs):
-            try:
-                results.extend(fut.result())
-            except Exception as e:
-                print(f"❌ Worker {futs[fut]} failed: {e}")
+    # One task per project: idle workers pick up the next page instead of
+    # waiting behind a slow page in a fixed chunk
+    session = build_session(pool_size=threads)
+    own_pool = driver_pool is None
+    if own_pool:
+        driver_pool = DriverPool(size=threads)
+    cache = open_cache() if use_cache else None
+    total = len(simplified)
+
+    def scrape(indexed_row):
+        i, row = indexed_row
+        return scrape_gtr_project(row, session, driver_pool, cache, progress=f"[{i}/{total}]")
+
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as ex:
+            results = list(ex.map(scrape, enumerate(simplified, 1)))
+    finally:
+        if own_pool:
+            driver_pool.close()
+        if cache is not None:
+            cache.close()
 
     # Build DataFrames
     df_all = pd.DataFrame(results)
@@ -422,38 +750,34 @@ def run_gtr_search_to_excel(search_term, max_records=200, threads=4):
         "Chief Investigators", "No. of PIs", "Co-Investigators", "No. of Co-Is"
     ]]
 
-    from collections import Counter
-    names = []
-    for _, row in df_all.iterrows():
-        for field in ["Chief Investigators", "Co-Investigators"]:
-            if row.get(field):
-                names += [n.strip() for n in str(row[field]).split(";") if n.strip()]
-    counts = Counter(names)
-    df_counts = pd.DataFrame(sorted(counts.items(), key=lambda x: x[1], reverse=True),
-                             columns=["Investigator Name", "Total Count"])
+    # Investigator counts: split/explode/count in pandas rather than per-row Python
+    names = pd.concat([df_all["Chief Investigators"], df_all["Co-Investigators"]]).dropna().astype(str)
+    names = names.str.split(";").explode().str.strip()
+    counts = names[names != ""].value_counts()
+    df_counts = counts.rename_axis("Investigator Name").reset_index(name="Total Count")
 
     classification = load_classification_label()
-    safe_term = re.sub(r"[^A-Za-z0-9_]+", "_", search_term).strip("_")
+    safe_term = _RX_SAFE_TERM.sub("_", search_term).strip("_")
     today = datetime.now().strftime("%Y%m%d")
     outfile = f"gtr_search_{safe_term}_{today}.xlsx"
 
-    # Write Excel
-    with pd.ExcelWriter(outfile, engine="xlsxwriter") as writer:
-        df_all.to_excel(writer, index=False, sheet_name="All Projects")
-        df_people.to_excel(writer, index=False, sheet_name="PI and Co-I Summary")
-        df_counts.to_excel(writer, index=False, sheet_name="Investigator Counts")
-
-        wb = writer.book
-        for sheet_name, df_curr in [("All Projects", df_all), ("PI and Co-I Summary", df_people)]:
-            ws = writer.sheets[sheet_name]
+    # Write Excel (constant_memory streams each row to disk as it is written)
+    with pd.ExcelWriter(outfile, engine="xlsxwriter",
+                        engine_kwargs={"options": {"constant_memory": True}}) as writer:
+        for sheet_name, df_curr, autosize in [
+            ("All Projects", df_all, True),
+            ("PI and Co-I Summary", df_people, True),
+            ("Investigator Counts", df_counts, False),
+        ]:
+            ws = write_sheet(writer, sheet_name, df_curr)
+            if not autosize:
+                continue
             ws.set_header('&C' + classification)
             ws.set_footer('&L' + classification + ' &R&P of &N')
-            for i, col in enumerate(df_curr.columns):
-                vals = df_curr[col].astype(str).tolist()
-                max_len = max([len(col)] + [len(v) for v in vals]) + 2
-                ws.set_column(i, i, min(max_len, 80))
+            for i, width in enumerate(column_widths(df_curr)):
+                ws.set_column(i, i, min(width, 80))
 
-    print(f"✅ Done. Wrote {len(df_all)} projects to Excel → {outfile}")
+    log.info("✅ Done. Wrote %s projects to Excel → %s", len(df_all), outfile)
 
 
 #  --------- Test Scraper only
@@ -472,7 +796,7 @@ def search_gtr_web(term, max_results=50):
     resp = requests.get(base_url, params=params, timeout=20)
     resp.raise_for_status()
 
-    soup = BeautifulSoup(resp.text, "html.parser")
+    soup = BeautifulSoup(resp.text, HTML_PARSER)
     results = []
     for card in soup.select(".search-result"):
         title_tag = card.select_one("a.search-title")
@@ -484,7 +808,7 @@ def search_gtr_web(term, max_results=50):
         snippet = abs_tag.get_text(strip=True) if abs_tag else ""
         results.append({"Title": title, "URL": url, "Snippet": snippet})
 
-    print(f"✅ Found {len(results)} results from web search.")
+    log.info("✅ Found %s results from web search.", len(results))
     return results
 
 
@@ -501,5 +825,5 @@ so for example ' "micro plastics" microplastics '
 
 # TODO check search filters like title - results are limited relevance sometimes
 if __name__ == "__main__":
-    # run_gtr_search_to_excel('"essential tremor" ', max_records=100, threads=4)
+    # run_gtr_search_to_excel('"essential tremor" ', max_records=100, threads=16)
     search_gtr_web('"health"')
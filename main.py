@@ -1,11 +1,18 @@
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 
-def get_organisation_id(university_name):
+# One pooled session for every GtR call, so TCP/TLS connections are reused
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+SESSION.headers.update({"Accept-Encoding": "gzip"})
+
+def get_organisation_id(university_name, session=SESSION):
     """Fetch the organization ID based on the university name."""
     url = f"https://gtr.ukri.org/gtr/api/organisations?q={university_name}"
     headers = {"Accept": "application/json"}
 
-    response = requests.get(url, headers=headers)
+    response = session.get(url, headers=headers)
     if response.status_code == 200:
         data = response.json()
         organisations = data.get('organisation', [])
@@ -19,24 +26,24 @@ def get_organisation_id(university_name):
         print("Error fetching organization data:", response.status_code)
         return None, None
 
-def get_projects(organisation_id, funder_id):
+def get_projects(organisation_id, funder_id, session=SESSION):
     """Fetch projects based on organization ID and funder ID."""
     url = f"https://gtr.ukri.org/gtr/api/projects?organisation={organisation_id}&funder={funder_id}"
     headers = {"Accept": "application/json"}
 
-    response = requests.get(url, headers=headers)
+    response = session.get(url, headers=headers)
     if response.status_code == 200:
         return response.json().get('project', [])
     else:
         print("Error fetching projects:", response.status_code)
         return []
 
-def get_funder_id(funder_name):
+def get_funder_id(funder_name, session=SESSION):
     """Fetch the funder ID based on the funder name."""
     url = f"https://gtr.ukri.org/gtr/api/organisations?q={funder_name}"
     headers = {"Accept": "application/json"}
 
-    response = requests.get(url, headers=headers)
+    response = session.get(url, headers=headers)
     if response.status_code == 200:
         data = response.json()
         funders = data.get('organisation', [])
@@ -56,8 +63,12 @@ def main():
     university_name = "University of the West of Scotland"
     funder_name = "mrc"
 
-    org_id, org_name = get_organisation_id(university_name)
-    funder_id, funder_display_name = get_funder_id(funder_name)
+    # The two lookups are independent, so run them side by side
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        org_future = pool.submit(get_organisation_id, university_name)
+        funder_future = pool.submit(get_funder_id, funder_name)
+        org_id, org_name = org_future.result()
+        funder_id, funder_display_name = funder_future.result()
 
     if org_id and funder_id:
         print(f"\nFetching projects for {org_name} funded by {funder_display_name}...\n")
@@ -1,20 +1,47 @@
 import os
 import re
+import json
+import calendar
+import tempfile
 import time
+import sqlite3
 import requests
 import pandas as pd
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from selectolax.lexbor import LexborHTMLParser
 from datetime import datetime
 from urllib.parse import quote
 from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
 import threading
+from collections import Counter
 
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chromium.remote_connection import ChromiumRemoteConnection
+from selenium.webdriver.remote.client_config import ClientConfig
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.common.by import By
+from selenium.common.exceptions import SessionNotCreatedException
 from selenium.webdriver.support import expected_conditions as EC
 
+# Shared keep-alive session for NIHR OpenData / award page requests
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504]),
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+SESSION.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": "gzip"})
+
+# Local cache of scraped award pages (Award ID → timeline rows + investigator blocks)
+CACHE_DB = "nihr_award_cache.db"
+CACHE_TTL = 7 * 24 * 3600  # seconds
+
 
 def load_classification_label():
     default = "University of the West of Scotland – INTERNAL"
@@ -26,18 +53,76 @@ def load_classification_label():
         return default
 
 
-def setup_driver():
+# Max concurrent HTTP connections from a WebDriver client to its chromedriver
+DRIVER_POOL_MAXSIZE = 16
+
+
+def setup_driver(profile="default"):
     opts = Options()
     opts.add_argument("--headless=new")
     opts.add_argument("--disable-gpu")
     opts.add_argument("--no-sandbox")
     opts.add_argument("--disable-dev-shm-usage")
-    return webdriver.Chrome(options=opts)
+    # Skip images/extensions and return at DOMContentLoaded; a persistent
+    # per-slot profile keeps Chrome's HTTP cache warm across pages and runs
+    opts.add_argument("--blink-settings=imagesEnabled=false")
+    opts.add_argument("--disable-extensions")
+    profile_arg = f"--user-data-dir={os.path.join(tempfile.gettempdir(), f'nihr-chrome-{profile}')}"
+    opts.add_argument(profile_arg)
+    opts.page_load_strategy = "eager"
+    try:
+        driver = webdriver.Chrome(options=opts)
+    except SessionNotCreatedException:
+        # Another run already holds this slot's profile (Chrome locks it): use a
+        # throwaway profile instead and delete it when the driver quits
+        tmp_profile = tempfile.TemporaryDirectory(prefix=f"nihr-chrome-{profile}-", ignore_cleanup_errors=True)
+        opts.arguments.remove(profile_arg)
+        opts.add_argument(f"--user-data-dir={tmp_profile.name}")
+        driver = webdriver.Chrome(options=opts)
+        quit_chrome = driver.quit
+
+        def quit_and_clean():
+            try:
+                quit_chrome()
+            finally:
+                tmp_profile.cleanup()
+
+        driver.quit = quit_and_clean
+
+    # Selenium's default urllib3 pool holds a single connection to chromedriver;
+    # widen it so overlapping commands don't get dropped with "pool is full"
+    service_url = driver.service.service_url
+    driver.command_executor.close()
+    driver.command_executor = ChromiumRemoteConnection(
+        remote_server_addr=service_url,
+        vendor_prefix="goog",
+        browser_name="chrome",
+        client_config=ClientConfig(
+            remote_server_addr=service_url,
+            init_args_for_pool_manager={"init_args_for_pool_manager": {"maxsize": DRIVER_POOL_MAXSIZE}},
+            # Selenium's usual command timeout; unset, it would wait forever on a wedged chromedriver
+            timeout=120,
+        ),
+    )
+    return driver
+
+
+# "Jan"/"January" (any case) -> month number, so dates skip strptime's regex machinery
+_MONTHS = {
+    name.casefold(): i
+    for i in range(1, 13)
+    for name in (calendar.month_abbr[i], calendar.month_name[i])
+}
 
 
 def parse_month_year(text):
     if not text:
         return None
+    parts = text.split()
+    if len(parts) == 2 and len(parts[1]) == 4 and parts[1].isdigit():
+        month = _MONTHS.get(parts[0].casefold())
+        if month:
+            return datetime(int(parts[1]), month, 1)
     for fmt in ("%b %Y", "%B %Y"):
         try:
             return datetime.strptime(text.strip(), fmt)
@@ -46,253 +131,413 @@ def parse_month_year(text):
     return None
 
 
-def choose_best_date(fields):
+def choose_best_dates(fields):
+    """
+    Vectorised best-date pick over a DataFrame of record fields: the first of
+    start/award/end/record dates whose leading YYYY-MM-DD parses, else NaT.
+    """
+    best = pd.Series(pd.NaT, index=fields.index, dtype="datetime64[ns]")
     for key in ["start_date", "award_date", "end_date", "record_timestamp"]:
-        val = fields.get(key)
-        if not val:
+        if key not in fields:
             continue
-        try:
-            return datetime.strptime(val[:10], "%Y-%m-%d")
-        except Exception:
-            try:
-                return datetime.fromisoformat(val.replace("Z", "+00:00"))
-            except Exception:
-                pass
-    return None
-
-
-def within_range(dt, start_dt, end_dt):
-    return dt and start_dt <= dt <= end_dt
+        parsed = pd.to_datetime(
+            fields[key].astype("string").str.slice(0, 10), format="%Y-%m-%d", errors="coerce"
+        )
+        best = best.fillna(parsed)
+    return best
 
 
-def fetch_all_hits(query, page_size=100):
+def fetch_all_hits(query, page_size=100, max_workers=8, start_date=None, end_date=None):
     base_url = "https://nihr.opendatasoft.com/api/records/1.0/search/"
     dataset = "infonihr-open-dataset"
-    head = requests.get(base_url, params={"dataset": dataset, "q": query, "rows": 0})
+    # Let OpenDataSoft drop records outside the window before we page through them.
+    # Match any of the dates choose_best_dates falls back through, so records with
+    # no start_date survive; the client-side best-date filter does the exact pick
+    if start_date and end_date:
+        window = f"[{start_date} TO {end_date}]"
+        dates = " OR ".join(f"{key}:{window}" for key in ("start_date", "award_date", "end_date", "record_timestamp"))
+        query = f"({query}) AND ({dates})"
+    head = SESSION.get(base_url, params={"dataset": dataset, "q": query, "rows": 0})
     head.raise_for_status()
     total = head.json().get("nhits", 0)
 
-    records, start = [], 0
-    while start < total:
+    # All offsets are known from nhits, so fetch every page concurrently
+    def fetch_page(start):
         params = {"dataset": dataset, "q": query, "rows": page_size, "start": start}
-        resp = requests.get(base_url, params=params)
+        resp = SESSION.get(base_url, params=params)
         resp.raise_for_status()
-        chunk = resp.json().get("records", [])
-        if not chunk:
-            break
-        records.extend(chunk)
-        start += page_size
+        return resp.json().get("records", [])
+
+    pages = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(fetch_page, start): start for start in range(0, total, page_size)}
+        for f in as_completed(futures):
+            pages[futures[f]] = f.result()
+
+    records = [rec for start in sorted(pages) for rec in pages[start]]
     return records, total
 
 
+# Award page selectors and investigator labels, built once at import
+_THREAD_ROW_SEL = ".thread-row"
+_COMP_SEL = ".icon-component, .wide-icon-component-details, .icon-component-details"
+_LABEL_SEL = ".icon-component-label, .form-label"
+_PI_LABEL = "chief investigator"
+_COI_LABEL = "co-investigator"
+# Sort key for protocols with no parseable date
+_SENTINEL_DT = datetime(1900, 1, 1)
+
+
+def fetch_award_html(project_url):
+    """
+    Fast path: GET the award page over the pooled session and parse it.
+    Returns (rows, comps) page data, or None when the static HTML has neither
+    timeline rows nor investigator blocks (i.e. it needs JS to render).
+    """
+    resp = SESSION.get(project_url, timeout=20)
+    resp.raise_for_status()
+    tree = LexborHTMLParser(resp.text)
+    if not tree.css_first(f"{_THREAD_ROW_SEL}, .icon-component"):
+        return None
+    return parse_award_tree(tree)
+
+
+# Selenium fallback: pull just the timeline rows and investigator blocks out of
+# the live DOM in one call (arguments: row, component and label selectors)
+EXTRACT_AWARD_JS = """
+const txt = el => el ? el.textContent.trim() : "";
+const rows = [];
+document.querySelectorAll(arguments[0]).forEach(r => {
+    const a = r.querySelector("a.thread-link[href]");
+    if (a) rows.push([txt(r.querySelector(".thread-date-col")), txt(a), a.getAttribute("href") || ""]);
+});
+const comps = [];
+document.querySelectorAll(arguments[1]).forEach(c => {
+    const lbl = c.querySelector(arguments[2]);
+    if (lbl) comps.push([txt(lbl), Array.from(c.querySelectorAll("a.std-link"), txt)]);
+});
+return {rows, comps};
+"""
+
+
 def scrape_award_page(driver, project_url):
     driver.get(project_url)
     try:
         WebDriverWait(driver, 6).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, ".thread-row"))
+            EC.presence_of_element_located((By.CSS_SELECTOR, _THREAD_ROW_SEL))
         )
     except Exception:
         time.sleep(2)
 
-    soup = BeautifulSoup(driver.page_source, "html.parser")
+    data = driver.execute_script(EXTRACT_AWARD_JS, _THREAD_ROW_SEL, _COMP_SEL, _LABEL_SEL)
+    return data["rows"], data["comps"]
 
-    # Protocol links
-    protocols = []
-    for row in soup.select(".thread-row"):
-        date_div = row.select_one(".thread-date-col")
-        date_text = date_div.get_text(strip=True) if date_div else None
-        a = row.select_one("a.thread-link[href]")
+
+def parse_award_tree(tree):
+    """Pull (date, text, href) timeline rows and (label, names) blocks from a parsed award page."""
+    rows = []
+    for row in tree.css(_THREAD_ROW_SEL):
+        a = row.css_first("a.thread-link[href]")
         if not a:
             continue
-        if "protocol" in a.get_text(strip=True).lower():
-            protocols.append({
-                "title": a.get_text(strip=True),
-                "url": a.get("href", ""),
-                "date": parse_month_year(date_text)
-            })
-    protocols.sort(key=lambda d: (d["date"] or datetime(1900, 1, 1)), reverse=True)
-
-    # Investigator names
-    def pick_names(label):
-        names = []
-        for comp in soup.select(".icon-component, .wide-icon-component-details, .icon-component-details"):
-            lbl = comp.select_one(".icon-component-label, .form-label")
-            if lbl and label.lower() in lbl.get_text(strip=True).lower():
-                for a in comp.select("a.std-link"):
-                    nm = a.get_text(strip=True)
-                    if nm and nm not in names:
-                        names.append(nm)
-        return names
-
-    pi_names = pick_names("Chief Investigator")
-    coi_names = pick_names("Co-investigators")
-    return protocols, pi_names, coi_names
+        date_div = row.css_first(".thread-date-col")
+        rows.append((
+            date_div.text(strip=True) if date_div else None,
+            a.text(strip=True),
+            a.attributes.get("href") or "",
+        ))
+
+    comps = []
+    for comp in tree.css(_COMP_SEL):
+        lbl = comp.css_first(_LABEL_SEL)
+        if lbl:
+            comps.append((lbl.text(strip=True), [a.text(strip=True) for a in comp.css("a.std-link")]))
+    return rows, comps
+
+
+def open_cache(path=CACHE_DB):
+    """Open (creating if needed) the SQLite award cache; safe to share across worker threads."""
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS awards (award_id TEXT PRIMARY KEY, page TEXT, fetched_at INTEGER)"
+    )
+    return conn
+
+
+_cache_lock = threading.Lock()
+
+
+def cache_get(conn, award_id, ttl=CACHE_TTL):
+    """Return cached (rows, comps) for a fresh award, else None."""
+    with _cache_lock:
+        row = conn.execute(
+            "SELECT page FROM awards WHERE award_id = ? AND fetched_at > ?",
+            (award_id, int(time.time()) - ttl),
+        ).fetchone()
+    if not row:
+        return None
+    page = json.loads(row[0])
+    return page["rows"], page["comps"]
+
+
+def cache_put(conn, award_id, rows, comps):
+    with _cache_lock:
+        conn.execute(
+            "INSERT OR REPLACE INTO awards (award_id, page, fetched_at) VALUES (?, ?, ?)",
+            (award_id, json.dumps({"rows": rows, "comps": comps}), int(time.time())),
+        )
+
+
+def build_award_result(rows, comps):
+    """Turn timeline rows and investigator blocks into (protocols, pis, cois)."""
+    # Protocol links
+    protocols = [
+        {"title": text, "url": href, "date": parse_month_year(date_text)}
+        for date_text, text, href in rows
+        if "protocol" in text.lower()
+    ]
+
+    # Investigator names - route each block on its casefolded label
+    # (dicts keep first-seen order without duplicates)
+    pi_names, coi_names = {}, {}
+    for label, block_names in comps:
+        label = label.casefold()
+        if _PI_LABEL in label:
+            names = pi_names
+        elif _COI_LABEL in label:
+            names = coi_names
+        else:
+            continue
+        for nm in block_names:
+            if nm:
+                names.setdefault(nm)
+    return protocols, list(pi_names), list(coi_names)
+
+
+# Columns holding raw URLs, written as native hyperlinks with this display text
+LINK_LABELS = {"Project URL": "Open", "Most Recent Protocol": "Protocol"}
+
+
+def write_sheet(writer, sheet_name, df, classification):
+    """
+    Write `df` to a new sheet row by row (constant_memory mode only accepts rows
+    in order), turning LINK_LABELS columns into write_url cells.
+    """
+    ws = writer.book.add_worksheet(sheet_name)
+    ws.set_header('&C' + classification)
+    ws.set_footer('&L' + classification + ' &R&P of &N')
+
+    for i, col in enumerate(df.columns):
+        if col in LINK_LABELS:
+            cell_len = len(LINK_LABELS[col])
+        else:
+            cell_len = df[col].astype(str).str.len().max() if len(df) else 0
+        ws.set_column(i, i, min(max(len(col), cell_len) + 2, 80))
+
+    ws.write_row(0, 0, list(df.columns), writer.book.add_format({"bold": True, "border": 1}))
+    link_cols = {i: LINK_LABELS[col] for i, col in enumerate(df.columns) if col in LINK_LABELS}
+    values = df.astype(object).where(df.notna(), "")
+    for r, row in enumerate(values.itertuples(index=False), start=1):
+        for c, v in enumerate(row):
+            if c in link_cols and v:
+                try:
+                    ws.write_url(r, c, v, string=link_cols[c])
+                    continue
+                except ValueError:
+                    pass  # relative or odd hrefs xlsxwriter can't link; keep the raw text
+            ws.write(r, c, v)
 
 
 # ---------------------------------------------------------------------
 # MAIN FUNCTION - only this changes to multithreading
 # ---------------------------------------------------------------------
-def run_search_to_excel(search_term, start_date, end_date, max_rows):
+def run_search_to_excel(search_term, start_date, end_date, max_rows, use_cache=True):
     start_dt = datetime.strptime(start_date, "%Y-%m-%d")
     end_dt = datetime.strptime(end_date, "%Y-%m-%d")
 
     print(f"🔍 Query: {search_term}")
     print(f"📅 Date window: {start_date} → {end_date}")
-    all_records, total_hits = fetch_all_hits(search_term)
+    all_records, total_hits = fetch_all_hits(search_term, start_date=start_date, end_date=end_date)
     print(f"   API returned {total_hits} total hits")
 
+    # The API already filters on start_date; re-checking the best date is a cheap safety net
+    fields = [rec.get("fields", {}) for rec in all_records]
+    best_dates = choose_best_dates(pd.DataFrame(fields))
+    in_range = best_dates.between(start_dt, end_dt)
+
     candidates = []
-    for rec in all_records:
-        f = rec.get("fields", {})
-        best = choose_best_date(f)
-        if within_range(best, start_dt, end_dt):
-            award_id = f.get("project_id") or f.get("project_reference") or ""
-            candidates.append({
-                "Award ID": award_id,
-                "Project Title": f.get("project_title", ""),
-                "Funding Stream": f.get("funding_stream") or f.get("programme") or f.get("programme_stream") or "",
-                "Start Date": f.get("start_date"),
-                "End Date": f.get("end_date"),
-                "Project URL": f.get("funding_and_awards_link") or f"https://fundingawards.nihr.ac.uk/award/{quote(award_id)}",
-                "_sort_date": best
-            })
+    for i in in_range[in_range].index:
+        f = fields[i]
+        award_id = f.get("project_id") or f.get("project_reference") or ""
+        candidates.append({
+            "Award ID": award_id,
+            "Project Title": f.get("project_title", ""),
+            "Funding Stream": f.get("funding_stream") or f.get("programme") or f.get("programme_stream") or "",
+            "Start Date": f.get("start_date"),
+            "End Date": f.get("end_date"),
+            "Project URL": f.get("funding_and_awards_link") or f"https://fundingawards.nihr.ac.uk/award/{quote(award_id)}",
+            "_sort_date": best_dates[i]
+        })
     candidates.sort(key=lambda r: r["_sort_date"], reverse=True)
     print(f"   After date filter: {len(candidates)} records")
 
     # ------------------------------
     # Multithreaded scraping section
     # ------------------------------
-    def scrape_batch(batch, wid):
-        driver = setup_driver()
-        results = []
-        for i, row in enumerate(batch, start=1):
-            aid = row["Award ID"]
-            print(f"🧵 Worker {wid}: [{i}/{len(batch)}] {aid}")
-            try:
-                protocols, pis, cois = scrape_award_page(driver, row["Project URL"])
-            except Exception as e:
-                print(f"⚠️ Worker {wid} error {aid}: {e}")
-                protocols, pis, cois = [], [], []
-            results.append({
-                **row,
-                "Protocol Count": len(protocols),
-                "Most Recent Protocol URL": protocols[0]["url"] if protocols else "",
-                "Most Recent Protocol Title": protocols[0]["title"] if protocols else "",
-                "Most Recent Protocol Date": (
-                    protocols[0]["date"].strftime("%Y-%m") if (protocols and protocols[0]["date"]) else ""
-                ),
-                "Chief Investigators": "; ".join(pis),
-                "No. of PIs": len(pis),
-                "Co-Investigators": "; ".join(cois),
-                "No. of Co-Is": len(cois)
-            })
-        driver.quit()
-        return results
     n_threads = min(4, max(1, len(candidates)))
-    chunk_size = (len(candidates) + n_threads - 1) // n_threads
-    chunks = [candidates[i:i + chunk_size] for i in range(0, len(candidates), chunk_size)]
 
-    enriched, lock = [], threading.Lock()
-    with ThreadPoolExecutor(max_workers=n_threads) as pool:
-        futures = {pool.submit(scrape_batch, chunk, i + 1): i for i, chunk in enumerate(chunks)}
-        for f in as_completed(futures):
-            res = f.result()
-            if not res: # check for empty list
-                print("⚠️ Empty result from one thread, skipping.")
-                continue
-            with lock:
-                enriched.extend(res)
+    # One (slot id, driver) per worker; each slot only starts Chrome the first
+    # time one of its pages needs the Selenium fallback, with its own profile dir
+    drivers = queue.Queue()
+    for wid in range(n_threads):
+        drivers.put((wid, None))
+    cache = open_cache() if use_cache else None
+
+    def scrape_one(row, i):
+        aid = row["Award ID"]
+        print(f"🧵 [{i}/{len(candidates)}] {aid}")
+        try:
+            page = cache_get(cache, aid) if (cache is not None and aid) else None
+            if page is None:
+                # Plain HTTP first; a failed fetch falls through to Selenium like a JS-only page
+                try:
+                    page = fetch_award_html(row["Project URL"])
+                except Exception as e:
+                    print(f"   ↪️ HTTP fetch failed for {aid} ({e}), using Selenium")
+                    page = None
+                if page is None:
+                    wid, driver = drivers.get()
+                    try:
+                        if driver is None:
+                            driver = setup_driver(profile=wid)
+                        page = scrape_award_page(driver, row["Project URL"])
+                    except Exception:
+                        # Dead chromedriver / crashed tab: drop it so this slot starts afresh
+                        if driver is not None:
+                            try:
+                                driver.quit()
+                            except Exception:
+                                pass
+                        driver = None
+                        raise
+                    finally:
+                        drivers.put((wid, driver))
+                # Errors and empty renders (e.g. a timed-out load) skip this,
+                # so failed loads get retried next run
+                if cache is not None and aid and (page[0] or page[1]):
+                    cache_put(cache, aid, *page)
+            protocols, pis, cois = build_award_result(*page)
+        except Exception as e:
+            print(f"⚠️ Error {aid}: {e}")
+            protocols, pis, cois = [], [], []
+        # Only the newest protocol is reported, so take the max rather than sorting
+        newest = max(protocols, key=lambda d: d["date"] or _SENTINEL_DT, default=None)
+        return {
+            **row,
+            "Protocol Count": len(protocols),
+            "Most Recent Protocol URL": newest["url"] if newest else "",
+            "Most Recent Protocol Title": newest["title"] if newest else "",
+            "Most Recent Protocol Date": (
+                newest["date"].strftime("%Y-%m") if (newest and newest["date"]) else ""
+            ),
+            "Chief Investigators": "; ".join(pis),
+            "No. of PIs": len(pis),
+            "Co-Investigators": "; ".join(cois),
+            "No. of Co-Is": len(cois),
+            "_pis": pis,
+            "_cois": cois
+        }
+
+    # One task per award so an idle worker always picks up the next page
+    enriched = [None] * len(candidates)
+    try:
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            futures = {pool.submit(scrape_one, row, i + 1): i for i, row in enumerate(candidates)}
+            for f in as_completed(futures):
+                enriched[futures[f]] = f.result()
+    finally:
+        while not drivers.empty():
+            _, driver = drivers.get_nowait()
+            if driver is not None:
+                driver.quit()
+        if cache is not None:
+            cache.close()
     print(f"✅ Completed scraping {len(enriched)} records using {n_threads} threads")
 
     # ------------------------------
     # Excel writing
     # ------------------------------
-    with_protocol = [r for r in enriched if r["Protocol Count"] > 0]
-
-    df_all = pd.DataFrame([
-        {
-            "Award ID": r["Award ID"],
-            "Project Title": r["Project Title"],
-            "Funding Stream": r["Funding Stream"],
-            "Start Date": r["Start Date"],
-            "End Date": r["End Date"],
-            "Project URL": f'=HYPERLINK("{r["Project URL"]}", "Open")',
-            "Protocol Count": r["Protocol Count"],
-            "Most Recent Protocol": (
-                f'=HYPERLINK("{r["Most Recent Protocol URL"]}", "Protocol")' if r["Most Recent Protocol URL"] else ""
-            ),
-            "Most Recent Protocol Title": r["Most Recent Protocol Title"],
-            "Most Recent Protocol Date": r["Most Recent Protocol Date"],
-            "Sort Date": r["_sort_date"].strftime("%Y-%m-%d")
-        }
-        for r in enriched
-    ])
-
-    df_with = pd.DataFrame([
-        {
-            "Award ID": r["Award ID"],
-            "Project Title": r["Project Title"],
-            "Funding Stream": r["Funding Stream"],
-            "Start Date": r["Start Date"],
-            "End Date": r["End Date"],
-            "Project URL": f'=HYPERLINK("{r["Project URL"]}", "Open")',
-            "Protocol Count": r["Protocol Count"],
-            "Most Recent Protocol": f'=HYPERLINK("{r["Most Recent Protocol URL"]}", "Protocol")',
-            "Most Recent Protocol Title": r["Most Recent Protocol Title"],
-            "Most Recent Protocol Date": r["Most Recent Protocol Date"],
-        }
-        for r in with_protocol[:max_rows]
-    ])
-
-    df_people = pd.DataFrame([
-        {
-            "Award ID": r["Award ID"],
-            "Project Title": r["Project Title"],
-            "Funding Stream": r["Funding Stream"],
-            "Project URL": f'=HYPERLINK("{r["Project URL"]}", "Open")',
-            "Chief Investigators": r["Chief Investigators"],
-            "No. of PIs": r["No. of PIs"],
-            "Co-Investigators": r["Co-Investigators"],
-            "No. of Co-Is": r["No. of Co-Is"],
-        }
-        for r in enriched
-    ])
-
-    from collections import Counter
-    all_names = []
-    for r in enriched:
-        for name_group in ["Chief Investigators", "Co-Investigators"]:
-            if r[name_group]:
-                all_names.extend([n.strip() for n in r[name_group].split(";") if n.strip()])
-    df_counts = pd.DataFrame(
-        sorted(Counter(all_names).items(), key=lambda x: x[1], reverse=True),
-        columns=["Investigator Name", "Total Count"]
-    )
+    # One pass over the results builds every column; the protocol sheet is a
+    # row subset of "All Checked" and the people sheet shares its first columns
+    award_ids, titles, streams, starts, ends, links = [], [], [], [], [], []
+    protocol_counts, protocol_links, protocol_titles, protocol_dates, sort_dates = [], [], [], [], []
+    pi_strings, pi_counts, coi_strings, coi_counts = [], [], [], []
+    with_rows = []
+    name_counts = Counter()
+    for i, r in enumerate(enriched):
+        award_ids.append(r["Award ID"])
+        titles.append(r["Project Title"])
+        streams.append(r["Funding Stream"])
+        starts.append(r["Start Date"])
+        ends.append(r["End Date"])
+        links.append(r["Project URL"])
+        protocol_counts.append(r["Protocol Count"])
+        protocol_links.append(r["Most Recent Protocol URL"])
+        protocol_titles.append(r["Most Recent Protocol Title"])
+        protocol_dates.append(r["Most Recent Protocol Date"])
+        sort_dates.append(r["_sort_date"].strftime("%Y-%m-%d"))
+        pi_strings.append(r["Chief Investigators"])
+        pi_counts.append(r["No. of PIs"])
+        coi_strings.append(r["Co-Investigators"])
+        coi_counts.append(r["No. of Co-Is"])
+        if r["Protocol Count"] > 0 and len(with_rows) < max_rows:
+            with_rows.append(i)
+        name_counts.update(r["_pis"])
+        name_counts.update(r["_cois"])
+
+    df_all = pd.DataFrame({
+        "Award ID": award_ids,
+        "Project Title": titles,
+        "Funding Stream": streams,
+        "Start Date": starts,
+        "End Date": ends,
+        "Project URL": links,
+        "Protocol Count": protocol_counts,
+        "Most Recent Protocol": protocol_links,
+        "Most Recent Protocol Title": protocol_titles,
+        "Most Recent Protocol Date": protocol_dates,
+        "Sort Date": sort_dates,
+    })
+
+    df_with = df_all.iloc[with_rows].drop(columns="Sort Date").reset_index(drop=True)
+
+    df_people = pd.DataFrame({
+        "Award ID": award_ids,
+        "Project Title": titles,
+        "Funding Stream": streams,
+        "Project URL": links,
+        "Chief Investigators": pi_strings,
+        "No. of PIs": pi_counts,
+        "Co-Investigators": coi_strings,
+        "No. of Co-Is": coi_counts,
+    })
+
+    df_counts = pd.DataFrame(name_counts.most_common(), columns=["Investigator Name", "Total Count"])
 
     safe_term = re.sub(r"[^A-Za-z0-9_]+", "_", search_term).strip("_")
     today = datetime.now().strftime("%Y%m%d")
     outfile = f"completed_searches/nihr_protocol_search_{safe_term}_{today}.xlsx"
     classification = load_classification_label()
 
-    with pd.ExcelWriter(outfile, engine="xlsxwriter") as writer:
-        df_all.to_excel(writer, index=False, sheet_name="All Checked")
-        df_with.to_excel(writer, index=False, sheet_name="Has Protocol Attachments")
-        df_people.to_excel(writer, index=False, sheet_name="PI and Co-I Summary")
-        df_counts.to_excel(writer, index=False, sheet_name="Investigator Counts")
-
-        wb = writer.book
+    with pd.ExcelWriter(outfile, engine="xlsxwriter",
+                        engine_kwargs={"options": {"constant_memory": True}}) as writer:
         for sheet_name, df_curr in [
             ("All Checked", df_all),
             ("Has Protocol Attachments", df_with),
             ("PI and Co-I Summary", df_people),
             ("Investigator Counts", df_counts)
         ]:
-            ws = writer.sheets[sheet_name]
-            ws.set_header('&C' + classification)
-            ws.set_footer('&L' + classification + ' &R&P of &N')
-            for i, col in enumerate(df_curr.columns):
-                max_len = max(len(col), *(len(str(v)) for v in df_curr[col])) + 2
-                ws.set_column(i, i, min(max_len, 80))
+            write_sheet(writer, sheet_name, df_curr, classification)
 
     print(f"✅ Done. Wrote {len(df_all)} projects to 'All Checked', "
           f"{len(df_with)} to 'Has Protocol Attachments', and "
@@ -1,16 +1,24 @@
 import os
-import json
+import orjson
 import time
-import random
+import sqlite3
+import tempfile
 import requests
 import logging
+import threading
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
+from concurrent.futures import ThreadPoolExecutor
 
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chromium.remote_connection import ChromiumRemoteConnection
+from selenium.webdriver.remote.client_config import ClientConfig
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.common.by import By
+from selenium.common.exceptions import SessionNotCreatedException
 from selenium.webdriver.support import expected_conditions as EC
 
 # --- CONFIGURATION ---
@@ -18,14 +26,32 @@ OUTPUT_FILE = "nihr_rag_dataset.jsonl"
 CURSOR_FILE = "scraper_cursor.txt"
 LOG_FILE = "scraper.log"
 
+# Local cache of award page timelines (project_id → timeline links), so reruns skip re-scraping
+CACHE_DB = "award_cache.db"
+CACHE_TTL = 7 * 24 * 3600  # seconds
+
 # API Settings
 API_BASE_URL = "https://nihr.opendatasoft.com/api/records/1.0/search/"
 DATASET_NAME = "infonihr-open-dataset"
 BATCH_SIZE = 10  # Process 10 items per API call to keep memory low
 
-# Rate Limiting (Seconds)
-MIN_SLEEP = 5
-MAX_SLEEP = 12
+# Browser user agent, shared by Chrome and the requests session
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
+
+# Rate Limiting - caps award page requests across all workers
+REQUESTS_PER_MINUTE = 6
+WORKERS = 3
+
+# --- HTTP SESSION (keep-alive + retries, shared by every API call) ---
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504]),
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+SESSION.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": "gzip"})
 
 # --- LOGGING SETUP ---
 logging.basicConfig(
@@ -38,7 +64,11 @@ logging.basicConfig(
 )
 
 
-def setup_driver():
+# Max concurrent HTTP connections from a WebDriver client to its chromedriver
+DRIVER_POOL_MAXSIZE = 16
+
+
+def setup_driver(profile="stage1"):
     """Starts the Headless Chrome Driver"""
     opts = Options()
     opts.add_argument("--headless=new")
@@ -46,9 +76,49 @@ def setup_driver():
     opts.add_argument("--no-sandbox")
     opts.add_argument("--disable-dev-shm-usage")
     # Add a user agent so we look like a normal browser, not a bot
-    opts.add_argument(
-        "user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36")
-    return webdriver.Chrome(options=opts)
+    opts.add_argument(f"user-agent={USER_AGENT}")
+    # Skip images/extensions and return at DOMContentLoaded; a persistent
+    # per-slot profile keeps Chrome's HTTP cache warm across pages and runs
+    opts.add_argument("--blink-settings=imagesEnabled=false")
+    opts.add_argument("--disable-extensions")
+    profile_arg = f"--user-data-dir={os.path.join(tempfile.gettempdir(), f'nihr-chrome-{profile}')}"
+    opts.add_argument(profile_arg)
+    opts.page_load_strategy = "eager"
+    try:
+        driver = webdriver.Chrome(options=opts)
+    except SessionNotCreatedException:
+        # Another run already holds this slot's profile (Chrome locks it): use a
+        # throwaway profile instead and delete it when the driver quits
+        tmp_profile = tempfile.TemporaryDirectory(prefix=f"nihr-chrome-{profile}-", ignore_cleanup_errors=True)
+        opts.arguments.remove(profile_arg)
+        opts.add_argument(f"--user-data-dir={tmp_profile.name}")
+        driver = webdriver.Chrome(options=opts)
+        quit_chrome = driver.quit
+
+        def quit_and_clean():
+            try:
+                quit_chrome()
+            finally:
+                tmp_profile.cleanup()
+
+        driver.quit = quit_and_clean
+
+    # Selenium's default urllib3 pool holds a single connection to chromedriver;
+    # widen it so overlapping commands don't get dropped with "pool is full"
+    service_url = driver.service.service_url
+    driver.command_executor.close()
+    driver.command_executor = ChromiumRemoteConnection(
+        remote_server_addr=service_url,
+        vendor_prefix="goog",
+        browser_name="chrome",
+        client_config=ClientConfig(
+            remote_server_addr=service_url,
+            init_args_for_pool_manager={"init_args_for_pool_manager": {"maxsize": DRIVER_POOL_MAXSIZE}},
+            # Selenium's usual command timeout; unset, it would wait forever on a wedged chromedriver
+            timeout=120,
+        ),
+    )
+    return driver
 
 
 def get_cursor():
@@ -78,22 +148,64 @@ def fetch_api_batch(start_offset):
         "sort": "project_id"  # Sort ensures consistent order for pagination
     }
     try:
-        resp = requests.get(API_BASE_URL, params=params, timeout=30)
+        resp = SESSION.get(API_BASE_URL, params=params, timeout=30)
         resp.raise_for_status()
-        data = resp.json()
+        data = orjson.loads(resp.content)
         return data.get("records", []), data.get("nhits", 0)
     except Exception as e:
         logging.error(f"API Error at offset {start_offset}: {e}")
         return [], 0
 
 
-def check_for_protocol(driver, project_url):
+# Selenium fallback: [text, href] of every timeline link, read straight from the DOM
+THREAD_LINKS_JS = """
+return Array.from(document.querySelectorAll(".thread-row a.thread-link[href]"),
+                  a => [a.textContent.trim(), a.getAttribute("href") || ""]);
+"""
+
+
+def find_protocol_link(links):
+    """Returns (bool, url_string, title_string) for the first protocol PDF among (text, href) links."""
+    # Look for any link containing "protocol"
+    for text, href in links:
+        if "protocol" in text.lower() and href.endswith(".pdf"):
+            # Found one!
+            return True, href, text
+    return False, None, None
+
+
+def thread_links(tree):
+    """(text, href) for each timeline link in a parsed award page."""
+    links = []
+    for row in tree.css(".thread-row"):
+        link = row.css_first("a.thread-link[href]")
+        if link:
+            links.append((link.text(strip=True), link.attributes.get("href") or ""))
+    return links
+
+
+def fetch_award_html(project_url):
+    """
+    Fast path: fetch the award page with the pooled session and parse it.
+    Returns its timeline links, or None if the static HTML has no timeline
+    rows and Selenium is needed.
+    """
+    resp = SESSION.get(project_url, timeout=30)
+    resp.raise_for_status()
+    tree = LexborHTMLParser(resp.text)
+    if not tree.css_first(".thread-row"):
+        return None
+    return thread_links(tree)
+
+
+def render_thread_links(driver, project_url):
     """
-    Scrapes the specific award page to find if a protocol PDF exists.
-    Returns: (bool, url_string, title_string)
+    Loads the specific award page with Selenium and reads its timeline links.
+    Only needed when the plain HTTP fetch finds no timeline (JS-rendered page).
+    Returns: list of (text, href), or None if the page couldn't be scraped
     """
     if not project_url:
-        return False, None, None
+        return None
 
     try:
         driver.get(project_url)
@@ -106,35 +218,153 @@ def check_for_protocol(driver, project_url):
             # If timeout, page might just be empty or different format, but we continue
             pass
 
-        soup = BeautifulSoup(driver.page_source, "html.parser")
-
-        # Look for any link containing "protocol"
-        for row in soup.select(".thread-row"):
-            link = row.select_one("a.thread-link[href]")
-            if link:
-                text = link.get_text(strip=True).lower()
-                href = link.get("href", "")
-
-                if "protocol" in text and href.endswith(".pdf"):
-                    # Found one!
-                    return True, href, link.get_text(strip=True)
+        return driver.execute_script(THREAD_LINKS_JS)
 
     except Exception as e:
         logging.warning(f"Selenium scrape error for {project_url}: {e}")
 
-    return False, None, None
+    return None
+
+
+def open_cache(path=CACHE_DB):
+    """Open (creating if needed) the SQLite award cache; safe to share across worker threads."""
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS awards (project_id TEXT PRIMARY KEY, links TEXT, fetched_at INTEGER)"
+    )
+    return conn
+
 
+_cache_lock = threading.Lock()
 
-def save_record(record):
-    """Appends a valid record to the JSONL file."""
-    with open(OUTPUT_FILE, "a", encoding="utf-8") as f:
-        f.write(json.dumps(record) + "\n")
+
+def cache_get(conn, project_id, ttl=CACHE_TTL):
+    """Return the cached timeline links for a fresh award, else None."""
+    with _cache_lock:
+        row = conn.execute(
+            "SELECT links FROM awards WHERE project_id = ? AND fetched_at > ?",
+            (project_id, int(time.time()) - ttl),
+        ).fetchone()
+    return orjson.loads(row[0]) if row else None
+
+
+def cache_put(conn, project_id, links):
+    with _cache_lock:
+        conn.execute(
+            "INSERT OR REPLACE INTO awards (project_id, links, fetched_at) VALUES (?, ?, ?)",
+            (project_id, orjson.dumps(links), int(time.time())),
+        )
+
+
+class RateLimiter:
+    """
+    Hands out evenly spaced request slots, shared across threads. A scrape
+    that already took longer than the interval gets its next slot straight away.
+    """
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class BrowserFallback:
+    """One lazily started Chrome, used by one worker at a time, for pages that need JS."""
+
+    def __init__(self):
+        self.driver = None
+        self._lock = threading.Lock()
+
+    def check(self, project_url):
+        with self._lock:
+            if self.driver is None:
+                self.driver = setup_driver()
+            return render_thread_links(self.driver, project_url)
+
+    def quit(self):
+        if self.driver is not None:
+            self.driver.quit()
+
+
+def process_item(item, limiter, browser, cache):
+    """Checks one API record for a protocol; returns its RAG entry, or None."""
+    fields = item.get("fields", {})
+    project_id = fields.get("project_id", "UNKNOWN")
+    project_url = fields.get(
+        "funding_and_awards_link") or f"https://fundingawards.nihr.ac.uk/award/{project_id}"
+
+    logging.info(f"Checking {project_id}...")
+
+    # Reruns and resumes read the timeline from the cache instead of the site;
+    # records without a project_id would all share the "UNKNOWN" key, so skip them
+    cacheable = bool(fields.get("project_id"))
+    links = cache_get(cache, project_id) if cacheable else None
+    if links is None:
+        # Be polite: wait for a request slot before touching the award page
+        limiter.acquire()
+
+        # Plain HTTP first, Selenium only if the page needs JS
+        try:
+            links = fetch_award_html(project_url)
+        except Exception as e:
+            logging.warning(f"HTTP fetch error for {project_url}, falling back to Selenium: {e}")
+        if links is None:
+            links = browser.check(project_url)
+        # Failed or empty scrapes (e.g. a page not hydrated yet) stay uncached
+        # so they're retried next run
+        if links and cacheable:
+            cache_put(cache, project_id, links)
+
+    # Check for Protocol
+    has_protocol, protocol_url, protocol_title = find_protocol_link(links or [])
+
+    if not has_protocol:
+        # Optional: Log that we checked it but found nothing
+        # logging.info(f"   No protocol for {project_id}")
+        return None
+
+    logging.info(f"✅ FOUND PROTOCOL: {project_id}")
+
+    # Construct the RAG Data Object
+    # We save the REMOTE URL now. Stage 2 will download it later.
+    return {
+        "id": project_id,
+        "title": fields.get("project_title"),
+        "abstract_scientific": fields.get("scientific_abstract"),
+        "abstract_plain": fields.get("plain_english_abstract"),
+        "amount": fields.get("award_amount"),
+        "start_date": fields.get("start_date"),
+        "status": fields.get("status"),
+        "program": fields.get("programme"),
+        "url_meta": project_url,
+        "protocol_url": protocol_url,
+        "protocol_filename": f"{project_id}_protocol.pdf",  # Calculated for Stage 2
+        "scraped_at": datetime.now().isoformat()
+    }
+
+
+def save_record(record, fh):
+    """Appends a valid record to the already-open JSONL file (flushed once per batch)."""
+    fh.write(orjson.dumps(record))
+    fh.write(b"\n")
 
 
 # --- MAIN LOOP ---
 def main():
-    driver = setup_driver()
+    browser = BrowserFallback()  # Chrome only starts if a page needs the Selenium fallback
+    limiter = RateLimiter(REQUESTS_PER_MINUTE)
+    cache = open_cache()
+    pool = ThreadPoolExecutor(max_workers=WORKERS)
     current_offset = get_cursor()
+    out_fh = open(OUTPUT_FILE, "ab", buffering=1 << 16)
 
     logging.info(f"🚀 Starting Scraper. Resuming from item {current_offset}...")
 
@@ -150,48 +380,16 @@ def main():
             logging.info(
                 f"Processing batch: {current_offset} to {current_offset + len(records)} (Total in DB: {total_hits})")
 
-            # 2. Iterate through the batch
-            for item in records:
-                fields = item.get("fields", {})
-                project_id = fields.get("project_id", "UNKNOWN")
-                project_url = fields.get(
-                    "funding_and_awards_link") or f"https://fundingawards.nihr.ac.uk/award/{project_id}"
-
-                logging.info(f"Checking {project_id}...")
-
-                # 3. Check for Protocol (The Selenium Part)
-                has_protocol, protocol_url, protocol_title = check_for_protocol(driver, project_url)
-
-                if has_protocol:
-                    logging.info(f"✅ FOUND PROTOCOL: {project_id}")
-
-                    # 4. Construct the RAG Data Object
-                    # We save the REMOTE URL now. Stage 2 will download it later.
-                    rag_entry = {
-                        "id": project_id,
-                        "title": fields.get("project_title"),
-                        "abstract_scientific": fields.get("scientific_abstract"),
-                        "abstract_plain": fields.get("plain_english_abstract"),
-                        "amount": fields.get("award_amount"),
-                        "start_date": fields.get("start_date"),
-                        "status": fields.get("status"),
-                        "program": fields.get("programme"),
-                        "url_meta": project_url,
-                        "protocol_url": protocol_url,
-                        "protocol_filename": f"{project_id}_protocol.pdf",  # Calculated for Stage 2
-                        "scraped_at": datetime.now().isoformat()
-                    }
-
-                    save_record(rag_entry)
-                else:
-                    # Optional: Log that we checked it but found nothing
-                    # logging.info(f"   No protocol for {project_id}")
-                    pass
-
-                # Polite sleep between web requests
-                time.sleep(random.randint(MIN_SLEEP, MAX_SLEEP))
-
-            # 5. Update Cursor after finishing the batch
+            # 2. Check the batch concurrently; the limiter keeps the overall request rate polite
+            entries = pool.map(lambda item: process_item(item, limiter, browser, cache), records)
+
+            # 3. Save hits in API order from this thread only
+            for rag_entry in entries:
+                if rag_entry is not None:
+                    save_record(rag_entry, out_fh)
+
+            # 4. Flush the batch's records, then update Cursor, so a resume never skips unsaved hits
+            out_fh.flush()
             current_offset += len(records)
             save_cursor(current_offset)
 
@@ -203,7 +401,10 @@ def main():
     except Exception as e:
         logging.error(f"💥 CRITICAL ERROR: {e}")
     finally:
-        driver.quit()
+        pool.shutdown(wait=True, cancel_futures=True)
+        out_fh.close()
+        cache.close()
+        browser.quit()
         logging.info(f"Driver closed. Last position saved: {current_offset}")
 
 
@@ -1,13 +1,32 @@
 import os
-import json
+import orjson
 import requests
 import time
 import logging
+import threading
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # --- CONFIGURATION ---
 INPUT_FILE = "nihr_rag_dataset.jsonl"
 DOWNLOAD_DIR = "nihr_pdfs"  # This is where your files will actually live
 LOG_FILE = "downloader.log"
+MAX_WORKERS = 8
+MIN_INTERVAL = 1.0  # Seconds between download starts on the same host
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
+
+# --- HTTP SESSION (keep-alive + retries, shared by every download) ---
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504]),
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+SESSION.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": "gzip"})
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,10 +35,33 @@ logging.basicConfig(
 )
 
 
-def download_file(url, local_filename):
+class HostRateLimiter:
+    """Spaces out request starts per host, shared across worker threads."""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        # Sleep outside the lock so other hosts/slots are handed out meanwhile
+        if slot > now:
+            time.sleep(slot - now)
+
+
+RATE_LIMITER = HostRateLimiter(MIN_INTERVAL)
+
+
+def download_file(url, local_filename, session=SESSION):
     """Downloads a file safely."""
     try:
-        response = requests.get(url, stream=True, timeout=60)
+        RATE_LIMITER.wait(url)
+        response = session.get(url, stream=True, timeout=60)
         response.raise_for_status()
 
         with open(local_filename, 'wb') as f:
@@ -44,12 +86,14 @@ def main():
 
     logging.info("Starting download process...")
 
-    with open(INPUT_FILE, 'r', encoding='utf-8') as f:
+    # 3. Build the worklist first, skipping anything already on disk (Resume capability)
+    worklist, queued = [], set()
+    with open(INPUT_FILE, 'rb') as f:
         for line_num, line in enumerate(f, 1):
             if not line.strip():
                 continue
 
-            record = json.loads(line)
+            record = orjson.loads(line)
 
             # Get the details we prepared in Stage 1
             pdf_url = record.get("protocol_url")
@@ -62,25 +106,32 @@ def main():
             # Construct the full local path
             local_path = os.path.join(DOWNLOAD_DIR, filename)
 
-            # 3. Check if we already have it (Resume capability)
-            if os.path.exists(local_path):
-                # Optional: Check file size to ensure it's not a corrupted 0kb file
-                if os.path.getsize(local_path) > 0:
-                    logging.info(f"Skipping {project_id} (Already exists)")
-                    continue
-
-            # 4. Download
-            logging.info(f"Downloading {project_id}...")
-            success = download_file(pdf_url, local_path)
+            # Check file size too, so a corrupted 0kb file gets fetched again
+            if os.path.exists(local_path) and os.path.getsize(local_path) > 0:
+                logging.info(f"Skipping {project_id} (Already exists)")
+                continue
 
-            if success:
-                # Be polite to the server
-                time.sleep(1)
+            # Two workers must never write the same file
+            if local_path in queued:
+                continue
+            queued.add(local_path)
+            worklist.append((project_id, pdf_url, local_path))
+
+    # 4. Download concurrently; the rate limiter keeps us polite per host
+    logging.info(f"Downloading {len(worklist)} files with {MAX_WORKERS} workers...")
+    failed = 0
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = {
+            pool.submit(download_file, pdf_url, local_path): project_id
+            for project_id, pdf_url, local_path in worklist
+        }
+        for future in as_completed(futures):
+            if future.result():
+                logging.info(f"Downloaded {futures[future]}")
             else:
-                # If download failed, you might want to log it to a "failed.txt" list
-                pass
+                failed += 1
 
-    logging.info("Download run complete.")
+    logging.info(f"Download run complete. {failed} failed.")
 
 
 if __name__ == "__main__":
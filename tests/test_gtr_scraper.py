@@ -0,0 +1,59 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gtr_scraper import simplify_gtr_projects  # noqa: E402
+
+
+class SimplifyGtrProjectsTest(unittest.TestCase):
+    def test_single_lead_participant_dict(self):
+        df = simplify_gtr_projects([{
+            "id": "abc",
+            "participantValues": {"participant": {"role": "LEAD_PARTICIPANT", "grantOffer": 1234}},
+        }])
+        self.assertEqual(df.loc[0, "Funded Value"], "£1,234")
+
+    def test_participant_list(self):
+        df = simplify_gtr_projects([{
+            "id": "abc",
+            "participantValues": {"participant": [
+                {"role": "PARTICIPANT", "grantOffer": 1},
+                {"role": "LEAD", "projectCost": 5678.4},
+            ]},
+        }])
+        self.assertEqual(df.loc[0, "Funded Value"], "£5,678")
+
+    def test_fund_block_wins_over_participants(self):
+        df = simplify_gtr_projects([{
+            "id": "abc",
+            "fund": {"amountPounds": 1000},
+            "participantValues": {"participant": {"role": "LEAD_PARTICIPANT", "grantOffer": 1234}},
+        }])
+        self.assertEqual(df.loc[0, "Funded Value"], "£1,000")
+
+    def test_identifiers_plain_list(self):
+        df = simplify_gtr_projects([{
+            "id": "abc",
+            "identifiers": [{"type": "RCUK", "value": "EP/X000001/1"}],
+        }])
+        self.assertEqual(df.loc[0, "Project URL"], "https://gtr.ukri.org/projects?ref=EP%2FX000001%2F1")
+
+    def test_identifiers_dict(self):
+        df = simplify_gtr_projects([{
+            "id": "abc",
+            "identifiers": {"identifier": [{"type": "RCUK", "value": "EP/X000001/1"}]},
+        }])
+        self.assertEqual(df.loc[0, "Project URL"], "https://gtr.ukri.org/projects?ref=EP%2FX000001%2F1")
+
+    def test_non_rcuk_identifier_falls_back_to_id(self):
+        df = simplify_gtr_projects([{
+            "id": "abc",
+            "identifiers": [{"type": "UKRI", "value": "123"}],
+        }])
+        self.assertEqual(df.loc[0, "Project URL"], "https://gtr.ukri.org/projects/abc")
+
+
+if __name__ == "__main__":
+    unittest.main()
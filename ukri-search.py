@@ -286,17 +286,96 @@
 import os
 import re
 import time
+import sqlite3
+import threading
+import multiprocessing
+import orjson
 import requests
 import pandas as pd
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer
+from lxml import etree, html as lxml_html
 from datetime import datetime
+from functools import lru_cache
 from urllib.parse import quote
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+
+
+# Number of scraping workers (each owns one headless Chrome); override via env var
+SCRAPE_WORKERS = int(os.environ.get("UKRI_SCRAPE_WORKERS", "6"))
+
+# Award pages at least this large are parsed in a separate process (off the GIL);
+# smaller ones are parsed in the scraping thread, where the IPC would cost more
+PARSE_IN_PROCESS_CHARS = 200_000
+# Parser processes share the machine with up to SCRAPE_WORKERS Chrome instances; keep them few
+PARSE_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+# Shared keep-alive session for OpenData and award page fetches (thread-safe for GETs)
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+SESSION.headers.update({"User-Agent": USER_AGENT})
+
+# Local cache of award page HTML (Award ID → page), so reruns skip the network and Chrome
+CACHE_DB = "ukri_search_cache.db"
+CACHE_TTL = 7 * 24 * 3600  # seconds
+
+# Subresources Chrome never needs to fetch for an award page
+BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.gif", "*.svg", "*.woff", "*.woff2", "*.css",
+    "*google-analytics*", "*googletagmanager*",
+]
+
+# Patterns and formats reused per record / per search, built once
+_SAFE_RE = re.compile(r"[^A-Za-z0-9_]+")
+_MY_FORMATS = ("%b %Y", "%B %Y")
+_ISO_DATE_LEN = 10  # "YYYY-MM-DD" prefix of the API's ISO timestamps
+
+# Per-project fields gathered by run_search_to_excel, and the columns of each sheet
+MASTER_COLS = [
+    "Award ID", "Project Title", "Funding Stream", "Start Date", "End Date", "Project URL",
+    "Protocol Count", "Most Recent Protocol URL", "Most Recent Protocol Title", "Most Recent Protocol Date",
+    "Chief Investigators", "No. of PIs", "Co-Investigators", "No. of Co-Is", "_sort_date",
+]
+WITH_COLS = [
+    "Award ID", "Project Title", "Funding Stream", "Start Date", "End Date", "Project URL",
+    "Protocol Count", "Most Recent Protocol", "Most Recent Protocol Title", "Most Recent Protocol Date",
+]
+ALL_COLS = WITH_COLS + ["Sort Date"]
+COUNT_COLS = ["Protocol Count", "No. of PIs", "No. of Co-Is"]
+PEOPLE_COLS = [
+    "Award ID", "Project Title", "Funding Stream", "Project URL",
+    "Chief Investigators", "No. of PIs", "Co-Investigators", "No. of Co-Is",
+]
+
+# Link columns written as native hyperlinks, with the label shown in the cell
+LINK_LABELS = {"Project URL": "Open", "Most Recent Protocol": "Protocol"}
+
+# Only build the award page subtrees BeautifulSoup reads (investigator blocks)
+AWARD_STRAINER = SoupStrainer(
+    class_=lambda c: bool(c) and ("icon-component" in c or "wide-icon-component-details" in c)
+)
+
+# Timeline extraction runs as compiled XPath over lxml.html (class-token matches)
+_HAS_CLASS = "contains(concat(' ', normalize-space(@class), ' '), ' {} ')"
+_THREAD_ROW_XP = etree.XPath("//*[" + _HAS_CLASS.format("thread-row") + "]")
+_THREAD_DATE_XP = etree.XPath(".//*[" + _HAS_CLASS.format("thread-date-col") + "]")
+_THREAD_LINK_XP = etree.XPath(".//a[" + _HAS_CLASS.format("thread-link") + " and @href]")
+_LABEL_CLASSES = ["icon-component-label", "form-label"]
 
 
 # ----------------------------
@@ -315,22 +394,32 @@ def load_classification_label() -> str:
 
 
 def setup_driver():
-    """Create a single headless Chrome driver for the whole run."""
+    """Create a headless Chrome driver (one per scraping worker)."""
     opts = Options()
     opts.add_argument("--headless=new")
     opts.add_argument("--disable-gpu")
     opts.add_argument("--no-sandbox")
     # Tame resource usage a bit
     opts.add_argument("--disable-dev-shm-usage")
-    return webdriver.Chrome(options=opts)
-
-
+    # Skip images / CSS / fonts and return at DOMContentLoaded
+    opts.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.managed_default_content_settings.stylesheets": 2,
+    })
+    opts.page_load_strategy = "eager"
+    driver = webdriver.Chrome(options=opts)
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
+    return driver
+
+
+@lru_cache(maxsize=1024)
 def parse_month_year(text):
     """Parse 'Aug 2023' or 'August 2023' → datetime(2023,8,1)."""
     if not text:
         return None
     text = text.strip()
-    for fmt in ("%b %Y", "%B %Y"):
+    for fmt in _MY_FORMATS:
         try:
             return datetime.strptime(text, fmt)
         except Exception:
@@ -338,90 +427,149 @@ def parse_month_year(text):
     return None
 
 
-def choose_best_date(fields: dict):
+# Date columns in order of preference, and the other fields a candidate row reads
+BEST_DATE_FIELDS = ["start_date", "award_date", "end_date", "record_timestamp"]
+CANDIDATE_FIELDS = [
+    "project_id", "project_reference", "project_title", "funding_stream", "programme",
+    "programme_stream", "funding_and_awards_link",
+]
+
+
+def choose_best_dates(fields: pd.DataFrame) -> pd.Series:
     """
     Prefer start_date, then award_date, then end_date, then record_timestamp.
-    Returns datetime or None.
+    Vectorised over all records; rows with no parseable date get NaT.
     """
-    candidates = [
-        fields.get("start_date"),
-        fields.get("award_date"),
-        fields.get("end_date"),
-        fields.get("record_timestamp"),
-    ]
-    for c in candidates:
-        if not c:
-            continue
-        # Try YYYY-MM-DD
-        try:
-            return datetime.strptime(c[:10], "%Y-%m-%d")
-        except Exception:
-            pass
-        # Try full ISO
-        try:
-            return datetime.fromisoformat(c.replace("Z", "+00:00"))
-        except Exception:
-            pass
-    return None
-
+    best = None
+    for col in BEST_DATE_FIELDS:
+        parsed = pd.to_datetime(
+            fields[col].astype("string").str.slice(0, _ISO_DATE_LEN), format="%Y-%m-%d", errors="coerce"
+        )
+        best = parsed if best is None else best.combine_first(parsed)
+    return best
 
-def within_range(dt: datetime, start_dt: datetime, end_dt: datetime) -> bool:
-    """Inclusive hard cut-off range check."""
-    if dt is None:
-        return False
-    return start_dt <= dt <= end_dt
 
+OPENDATA_URL = "https://nihr.opendatasoft.com/api/records/1.0/search/"
+OPENDATA_DATASET = "infonihr-open-dataset"
 
-def fetch_all_hits(query: str, page_size: int = 100):
-    """Fetch all records for a query from NIHR OpenData (paginated)."""
-    base_url = "https://nihr.opendatasoft.com/api/records/1.0/search/"
-    dataset = "infonihr-open-dataset"
 
-    head = requests.get(base_url, params={"dataset": dataset, "q": query, "rows": 0})
+def count_hits(query: str) -> int:
+    """Total number of NIHR OpenData records matching a query."""
+    head = SESSION.get(OPENDATA_URL, params={"dataset": OPENDATA_DATASET, "q": query, "rows": 0})
     head.raise_for_status()
-    total = head.json().get("nhits", 0)
+    return orjson.loads(head.content).get("nhits", 0)
+
 
-    records, start = [], 0
-    while start < total:
-        params = {"dataset": dataset, "q": query, "rows": page_size, "start": start}
-        resp = requests.get(base_url, params=params)
+def iter_hit_pages(query: str, total: int, page_size: int = 100, max_workers: int = 8):
+    """
+    Yield each page (list of records) for a query, in offset order. Pages are
+    fetched concurrently, but each one can be filtered and dropped as it arrives
+    instead of holding every record in memory.
+    """
+    def fetch_page(start):
+        params = {"dataset": OPENDATA_DATASET, "q": query, "rows": page_size, "start": start}
+        resp = SESSION.get(OPENDATA_URL, params=params)
         resp.raise_for_status()
-        chunk = resp.json().get("records", [])
-        if not chunk:
-            break
-        records.extend(chunk)
-        start += page_size
+        return orjson.loads(resp.content).get("records", [])
 
-    return records, total
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        yield from pool.map(fetch_page, range(0, total, page_size))
 
 
-def scrape_award_page(driver, project_url: str):
-    """
-    Visit an award page and extract:
-      - protocol entries (list of {title, url, date})
-      - PI names (list)
-      - Co-I names (list)
-    """
+def filter_candidates(records, start_dt: datetime, end_dt: datetime):
+    """Candidate rows (with best date) for the records whose best date is inside the window."""
+    # Date parsing vectorised in pandas
+    fields = pd.json_normalize([rec.get("fields", {}) for rec in records])
+    fields = fields.reindex(columns=fields.columns.union(BEST_DATE_FIELDS + CANDIDATE_FIELDS))
+    fields["best"] = choose_best_dates(fields)
+    fields = fields.loc[fields["best"].between(start_dt, end_dt)]
+
+    candidates = []
+    for f in fields.astype(object).where(fields.notna(), None).to_dict(orient="records"):
+        award_id = f["project_id"] or f["project_reference"] or ""
+        candidates.append({
+            "Award ID": award_id,
+            "Project Title": f["project_title"] or "",
+            "Funding Stream": f["funding_stream"] or f["programme"] or f["programme_stream"] or "",
+            "Start Date": f["start_date"],
+            "End Date": f["end_date"],
+            "Project URL": f["funding_and_awards_link"] or f"https://fundingawards.nihr.ac.uk/award/{quote(award_id)}",
+            "_sort_date": f["best"]
+        })
+    return candidates
+
+
+def fetch_award_html(project_url: str) -> str:
+    """Fetch the server-rendered award page HTML over the shared session."""
+    resp = SESSION.get(project_url, timeout=10)
+    resp.raise_for_status()
+    return resp.text
+
+
+def has_award_content(html: str) -> bool:
+    """True if the page carries the timeline or investigator markup we parse."""
+    return "thread-row" in html or "icon-component" in html
+
+
+def open_cache(path: str = CACHE_DB):
+    """Open (creating if needed) the SQLite page cache; safe to share across worker threads."""
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("CREATE TABLE IF NOT EXISTS pages (award_id TEXT PRIMARY KEY, html TEXT, fetched_at INTEGER)")
+    return conn
+
+
+_cache_lock = threading.Lock()
+
+
+def cache_get(conn, award_id: str, ttl: int = CACHE_TTL):
+    """Return the cached HTML for a fresh award page, else None."""
+    with _cache_lock:
+        row = conn.execute(
+            "SELECT html FROM pages WHERE award_id = ? AND fetched_at > ?",
+            (award_id, int(time.time()) - ttl),
+        ).fetchone()
+    return row[0] if row else None
+
+
+def cache_put(conn, award_id: str, html: str):
+    with _cache_lock:
+        conn.execute(
+            "INSERT OR REPLACE INTO pages (award_id, html, fetched_at) VALUES (?, ?, ?)",
+            (award_id, html, int(time.time())),
+        )
+
+
+def render_award_html(driver, project_url: str) -> str:
+    """Selenium fallback: render the award page in Chrome and return its HTML."""
     driver.get(project_url)
-    # Wait for the timeline; if slow, fallback to a short sleep
+    # Wait for either the timeline or the investigator blocks; if neither ever
+    # appears the page has no such content, so parse straight away
     try:
-        WebDriverWait(driver, 6).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, ".thread-row"))
-        )
-    except Exception:
-        time.sleep(2)
+        WebDriverWait(driver, 6).until(EC.any_of(
+            EC.presence_of_element_located((By.CSS_SELECTOR, ".thread-row")),
+            EC.presence_of_element_located((By.CSS_SELECTOR, ".icon-component")),
+        ))
+    except TimeoutException:
+        pass
 
-    soup = BeautifulSoup(driver.page_source, "html.parser")
+    return driver.page_source
+
+
+def parse_award_protocols(html: str):
+    """Timeline “thread-row” items with Protocol link text, newest first (no PI/Co-I pass)."""
+    if not html or not html.strip():
+        return []
+    tree = lxml_html.fromstring(html)
 
-    # --- Protocols (timeline “thread-row” items with Protocol link text)
     protocols = []
-    for row in soup.select(".thread-row"):
-        date_div = row.select_one(".thread-date-col")
-        date_text = date_div.get_text(strip=True) if date_div else None
-        a = row.select_one("a.thread-link[href]")
-        if not a:
+    for row in _THREAD_ROW_XP(tree):
+        date_divs = _THREAD_DATE_XP(row)
+        date_text = date_divs[0].text_content().strip() if date_divs else None
+        links = _THREAD_LINK_XP(row)
+        if not links:
             continue
-        link_text = a.get_text(strip=True)
+        a = links[0]
+        link_text = a.text_content().strip()
         href = a.get("href", "")
         if "protocol" in link_text.lower():
             protocols.append({
@@ -430,33 +578,43 @@ def scrape_award_page(driver, project_url: str):
                 "date": parse_month_year(date_text)
             })
     protocols.sort(key=lambda d: (d["date"] or datetime(1900, 1, 1)), reverse=True)
+    return protocols
+
+
+def parse_award_html(html: str):
+    """
+    Extract from award page HTML:
+      - protocol entries (list of {title, url, date})
+      - PI names (list)
+      - Co-I names (list)
+    """
+    # --- Protocols (timeline “thread-row” items with Protocol link text)
+    protocols = parse_award_protocols(html)
+
+    soup = BeautifulSoup(html, "lxml", parse_only=AWARD_STRAINER)
 
     # --- PI & Co-I names (from the icon-component blocks)
-    # Robust selection: find label divs then sibling value area
-    def pick_names(label_contains: str):
-        names = []
-        for comp in soup.select(".icon-component, .wide-icon-component-details, .icon-component-details"):
-            label = comp.select_one(".icon-component-label, .form-label")
-            if not label:
-                continue
-            if label_contains.lower() in label.get_text(strip=True).lower():
-                val = comp.find_next(class_="icon-component-value") or comp.find_next(class_="wide-icon-component-details") or comp
-                if val:
-                    for a in val.select("a.std-link"):
-                        nm = a.get_text(strip=True)
-                        if nm:
-                            names.append(nm)
-        # Deduplicate while preserving order
-        seen = set()
-        uniq = []
-        for n in names:
-            if n not in seen:
-                seen.add(n)
-                uniq.append(n)
-        return uniq
-
-    pi_names = pick_names("Chief Investigator")
-    coi_names = pick_names("Co-investigators")
+    # Robust selection: find label divs then sibling value area.
+    # One pass over the components fills both lists (dicts keep order, drop repeats).
+    pi_seen, coi_seen = {}, {}
+    for comp in soup.select(".icon-component, .wide-icon-component-details, .icon-component-details"):
+        label = comp.find(class_=_LABEL_CLASSES)
+        if not label:
+            continue
+        label_text = label.get_text(" ", strip=True).lower()
+        targets = [seen for key, seen in (("chief investigator", pi_seen), ("co-investigators", coi_seen))
+                   if key in label_text]
+        if not targets:
+            continue
+        val = comp.find_next(class_="icon-component-value") or comp.find_next(class_="wide-icon-component-details") or comp
+        for a in val.select("a.std-link"):
+            nm = a.get_text(strip=True)
+            if nm:
+                for seen in targets:
+                    seen.setdefault(nm)
+
+    pi_names = list(pi_seen)
+    coi_names = list(coi_seen)
 
     return protocols, pi_names, coi_names
 
@@ -465,10 +623,15 @@ def scrape_award_page(driver, project_url: str):
 # Main entry
 # ----------------------------
 
-def run_search_to_excel(search_term: str, start_date: str, end_date: str, max_rows: int):
+def run_search_to_excel(search_term: str, start_date: str, end_date: str, max_rows: int, use_cache: bool = True,
+                        protocols_only: bool = False):
     """
     - Hard date cut-offs (inclusive).
     - Scrape ALL filtered records (so we can populate PI/Co-I and protocol counts).
+      With protocols_only=True, skip PI/Co-I extraction and stop once max_rows
+      projects with protocols are found (newest first); "All Checked" then only
+      lists the projects actually scraped. The mode is opt-in: set it from a
+      caller or via `protocols_only` in the example block at the bottom.
     - Create 3 sheets:
         1) All Checked (all filtered projects)
         2) Has Protocol Attachments (subset; up to max_rows by newest)
@@ -481,46 +644,64 @@ def run_search_to_excel(search_term: str, start_date: str, end_date: str, max_ro
     print(f"🔎 Query: {search_term}")
     print(f"📅 Date window: {start_date} → {end_date} (inclusive)")
 
-    all_records, total_hits = fetch_all_hits(search_term)
+    total_hits = count_hits(search_term)
     print(f"   API hits before date filter: {total_hits}")
 
-    # Build candidate list with best date + basics
+    # Build candidate list with best date + basics, filtering each page as it arrives
     candidates = []
-    for rec in all_records:
-        f = rec.get("fields", {})
-        award_id = f.get("project_id") or f.get("project_reference") or ""
-        title = f.get("project_title", "")
-        stream = f.get("funding_stream") or f.get("programme") or f.get("programme_stream") or ""
-        start = f.get("start_date")
-        end   = f.get("end_date")
-        project_url = f.get("funding_and_awards_link") or f"https://fundingawards.nihr.ac.uk/award/{quote(award_id)}"
-        best = choose_best_date(f)
-        if within_range(best, start_dt, end_dt):
-            candidates.append({
-                "Award ID": award_id,
-                "Project Title": title,
-                "Funding Stream": stream,
-                "Start Date": start,
-                "End Date": end,
-                "Project URL": project_url,
-                "_sort_date": best
-            })
+    for page in iter_hit_pages(search_term, total_hits):
+        candidates.extend(filter_candidates(page, start_dt, end_dt))
 
     print(f"   After date filter: {len(candidates)} records")
 
     # Sort newest first
     candidates.sort(key=lambda r: r["_sort_date"], reverse=True)
 
-    # Scrape all filtered records (for protocol + PI/Co-I info)
-    driver = setup_driver()
-    enriched = []
+    # Scrape all filtered records (for protocol + PI/Co-I info).
+    # Each worker thread lazily starts its own Chrome and keeps it for the run.
+    local = threading.local()
+    cache = open_cache() if use_cache else None
+    drivers, drivers_lock = [], threading.Lock()
+    # Spawned, not forked: workers start lazily from scraping threads, and a fork
+    # there could copy a lock another thread holds (e.g. strptime's) into the child
+    parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    parser = parse_award_protocols if protocols_only else parse_award_html
     total = len(candidates)
-    for i, row in enumerate(candidates, start=1):
+
+    def worker_driver():
+        if getattr(local, "driver", None) is None:
+            local.driver = setup_driver()
+            with drivers_lock:
+                drivers.append(local.driver)
+        return local.driver
+
+    def scrape(i, row):
         aid = row["Award ID"]
         url = row["Project URL"]
         print(f"   [{i}/{total}] Scraping {aid} …")
         try:
-            protocols, pi_names, coi_names = scrape_award_page(driver, url)
+            html = cache_get(cache, aid) if (cache is not None and aid) else None
+            if html is None:
+                # Plain HTTP first; only render in Chrome if the page needs JS
+                try:
+                    html = fetch_award_html(url)
+                except Exception as e:
+                    print(f"      ↪️ HTTP fetch failed for {aid} ({e}), using Selenium")
+                    html = ""
+                if not has_award_content(html):
+                    html = render_award_html(worker_driver(), url)
+                # Error/interstitial/empty pages (e.g. after a render timeout) stay
+                # uncached so they're retried next run
+                if cache is not None and aid and has_award_content(html):
+                    cache_put(cache, aid, html)
+            if len(html) >= PARSE_IN_PROCESS_CHARS:
+                parsed = parse_pool.submit(parser, html).result()
+            else:
+                parsed = parser(html)
+            if protocols_only:
+                protocols, pi_names, coi_names = parsed, [], []
+            else:
+                protocols, pi_names, coi_names = parsed
         except Exception as e:
             print(f"      ⚠️ Error scraping {aid}: {e}")
             protocols, pi_names, coi_names = [], [], []
@@ -532,7 +713,7 @@ def run_search_to_excel(search_term: str, start_date: str, end_date: str, max_ro
             protocols[0]["date"].strftime("%Y-%m") if (protocol_count and protocols[0]["date"]) else ""
         )
 
-        enriched.append({
+        return {
             **row,
             "Protocol Count": protocol_count,
             "Most Recent Protocol URL": most_recent_protocol_url,
@@ -542,81 +723,58 @@ def run_search_to_excel(search_term: str, start_date: str, end_date: str, max_ro
             "No. of PIs": len(pi_names),
             "Co-Investigators": "; ".join(coi_names) if coi_names else "",
             "No. of Co-Is": len(coi_names),
-        })
-
-    driver.quit()
-
-    # Build DataFrames
-    df_all = pd.DataFrame([
-        {
-            "Award ID": r["Award ID"],
-            "Project Title": r["Project Title"],
-            "Funding Stream": r["Funding Stream"],
-            "Start Date": r["Start Date"],
-            "End Date": r["End Date"],
-            "Project URL": f'=HYPERLINK("{r["Project URL"]}", "Open")',
-            "Protocol Count": r["Protocol Count"],
-            "Most Recent Protocol": (
-                f'=HYPERLINK("{r["Most Recent Protocol URL"]}", "Protocol")' if r["Most Recent Protocol URL"] else ""
-            ),
-            "Most Recent Protocol Title": r["Most Recent Protocol Title"],
-            "Most Recent Protocol Date": r["Most Recent Protocol Date"],
-            "Sort Date": r["_sort_date"].strftime("%Y-%m-%d") if isinstance(r["_sort_date"], datetime) else ""
         }
-        for r in enriched
-    ])
 
-    # Subset with protocols; limit to max_rows by newest (already sorted)
-    with_protocol = [r for r in enriched if r["Protocol Count"] > 0]
-    df_with = pd.DataFrame([
-        {
-            "Award ID": r["Award ID"],
-            "Project Title": r["Project Title"],
-            "Funding Stream": r["Funding Stream"],
-            "Start Date": r["Start Date"],
-            "End Date": r["End Date"],
-            "Project URL": f'=HYPERLINK("{r["Project URL"]}", "Open")',
-            "Protocol Count": r["Protocol Count"],
-            "Most Recent Protocol": f'=HYPERLINK("{r["Most Recent Protocol URL"]}", "Protocol")',
-            "Most Recent Protocol Title": r["Most Recent Protocol Title"],
-            "Most Recent Protocol Date": r["Most Recent Protocol Date"],
-        }
-        for r in with_protocol[:max_rows]
-    ])
+    workers = max(1, min(SCRAPE_WORKERS, total))
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            if protocols_only:
+                # Scrape newest first, one batch per round of workers, and stop
+                # as soon as enough projects with protocols have turned up
+                enriched = []
+                for start in range(0, total, workers):
+                    batch = candidates[start:start + workers]
+                    enriched.extend(pool.map(scrape, range(start + 1, start + len(batch) + 1), batch))
+                    if sum(1 for r in enriched if r["Protocol Count"] > 0) >= max_rows:
+                        print(f"   Found {max_rows} projects with protocols after {len(enriched)} pages; stopping")
+                        break
+            else:
+                # Results are slotted back by index so the newest-first order survives
+                enriched = [None] * total
+                futures = {pool.submit(scrape, i, row): i - 1 for i, row in enumerate(candidates, start=1)}
+                for f in as_completed(futures):
+                    enriched[futures[f]] = f.result()
+    finally:
+        for driver in drivers:
+            driver.quit()
+        parse_pool.shutdown()
+        if cache is not None:
+            cache.close()
+
+    # Build one master frame, then derive each sheet by column selection
+    df_master = pd.DataFrame.from_records(enriched, columns=MASTER_COLS).rename(
+        columns={"Most Recent Protocol URL": "Most Recent Protocol"}
+    )
+    # Few distinct funding streams, small counts: store them compactly
+    df_master["Funding Stream"] = df_master["Funding Stream"].astype("category")
+    df_master[COUNT_COLS] = df_master[COUNT_COLS].astype("Int32")
+    df_master["Sort Date"] = pd.to_datetime(df_master["_sort_date"], errors="coerce").dt.strftime("%Y-%m-%d").fillna("")
 
+    df_all = df_master[ALL_COLS]
+    # Subset with protocols; limit to max_rows by newest (already sorted)
+    df_with = df_master.loc[df_master["Protocol Count"] > 0, WITH_COLS].head(max_rows)
     # PI/Co-I Summary for ALL projects
-    df_people = pd.DataFrame([
-        {
-            "Award ID": r["Award ID"],
-            "Project Title": r["Project Title"],
-            "Funding Stream": r["Funding Stream"],
-            "Project URL": f'=HYPERLINK("{r["Project URL"]}", "Open")',
-            "Chief Investigators": r["Chief Investigators"],
-            "No. of PIs": r["No. of PIs"],
-            "Co-Investigators": r["Co-Investigators"],
-            "No. of Co-Is": r["No. of Co-Is"],
-        }
-        for r in enriched
-    ])
+    df_people = df_master[PEOPLE_COLS]
 
     # --- Investigator Counts (new sheet) ---
-    from collections import Counter
-
-    all_names = []
-    for r in enriched:
-        if r["Chief Investigators"]:
-            all_names.extend([n.strip() for n in r["Chief Investigators"].split(";") if n.strip()])
-        if r["Co-Investigators"]:
-            all_names.extend([n.strip() for n in r["Co-Investigators"].split(";") if n.strip()])
-
-    counts = Counter(all_names)
-    df_counts = pd.DataFrame(
-        sorted(counts.items(), key=lambda x: x[1], reverse=True),
-        columns=["Investigator Name", "Total Count"]
-    )
+    names = pd.concat(
+        [df_master["Chief Investigators"], df_master["Co-Investigators"]], ignore_index=True
+    ).str.split(";").explode().str.strip()
+    names = names[names.notna() & (names != "")]
+    df_counts = names.value_counts().rename_axis("Investigator Name").reset_index(name="Total Count")
 
     # Output path with date-stamped filename
-    safe_term = re.sub(r"[^A-Za-z0-9_]+", "_", search_term).strip("_")
+    safe_term = _SAFE_RE.sub("_", search_term).strip("_")
     today = datetime.now().strftime("%Y%m%d")
     outfile = f"nihr_protocol_search_{safe_term}_{today}.xlsx"
 
@@ -631,6 +789,7 @@ def run_search_to_excel(search_term: str, start_date: str, end_date: str, max_ro
                            sheet_name="Investigator Counts")
 
         wb = writer.book
+        link_fmt = wb.add_format({"color": "blue", "underline": 1})
         for sheet_name, df_curr in [
             ("All Checked", df_all),
             ("Has Protocol Attachments", df_with),
@@ -640,11 +799,29 @@ def run_search_to_excel(search_term: str, start_date: str, end_date: str, max_ro
             # Header/footer classification
             ws.set_header('&C' + classification)
             ws.set_footer('&L' + classification + ' &R&P of &N')
-            # Autosize columns (cap width at 80)
+            # Overwrite the raw URL cells with native hyperlinks showing a short label
+            for col_name, label in LINK_LABELS.items():
+                if col_name not in df_curr.columns:
+                    continue
+                col_idx = df_curr.columns.get_loc(col_name)
+                for row_idx, url in enumerate(df_curr[col_name], start=1):
+                    if not url:
+                        continue
+                    try:
+                        ws.write_url(row_idx, col_idx, url, link_fmt, string=label)
+                    except ValueError:
+                        # Relative or otherwise unsupported URL; leave it as plain text
+                        ws.write(row_idx, col_idx, url)
+            # Autosize columns (cap width at 80); longest cell per column computed once in pandas
+            if len(df_curr):
+                lens = df_curr.astype(object).fillna("").astype(str).apply(lambda col: col.str.len().max())
+            else:
+                lens = pd.Series(0, index=df_curr.columns)
+            for col_name, label in LINK_LABELS.items():
+                if col_name in lens.index:
+                    lens[col_name] = len(label)
             for col_idx, col_name in enumerate(df_curr.columns):
-                vals = df_curr[col_name].astype(str).tolist()
-                max_len = max([len(col_name)] + [len(v) for v in vals]) + 2
-                ws.set_column(col_idx, col_idx, min(max_len, 80))
+                ws.set_column(col_idx, col_idx, min(max(len(col_name), int(lens[col_name])) + 2, 80))
 
     print(f"✅ Done. Wrote {len(df_all)} projects to 'All Checked', "
           f"{len(df_with)} to 'Has Protocol Attachments', and "
@@ -661,10 +838,13 @@ if __name__ == "__main__":
     start_date  = '2019-01-01'
     end_date    = '2025-10-01'
     max_rows    = 20
+    # True: stop once max_rows projects with protocols are found (no PI/Co-I data)
+    protocols_only = False
 
     run_search_to_excel(
         search_term=search_term,
         start_date=start_date,
         end_date=end_date,
-        max_rows=max_rows
+        max_rows=max_rows,
+        protocols_only=protocols_only
     )
@@ -1,16 +1,41 @@
-import os
 import re
 import time
+import calendar
+import sqlite3
+import threading
 import requests
 import pandas as pd
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import etree, html as lxml_html
 from datetime import datetime
+from itertools import chain
+from collections import Counter
 from urllib.parse import quote
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
+
+# Shared keep-alive session for award page fetches (thread-safe for GETs)
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+SESSION.headers.update({"User-Agent": USER_AGENT})
+
+# Local cache of award page HTML (Project URL → page), so reruns skip the network
+CACHE_DB = "protocol_finder_cache.db"
+CACHE_TTL = 24 * 3600  # seconds
+
+# Timeline rows are read with compiled XPath over lxml.html (class-token matches)
+_HAS_CLASS = "contains(concat(' ', normalize-space(@class), ' '), ' {} ')"
+_THREAD_ROW_XP = etree.XPath("//*[" + _HAS_CLASS.format("thread-row") + "]")
+_THREAD_DATE_XP = etree.XPath(".//*[" + _HAS_CLASS.format("thread-date-col") + "]")
+_THREAD_LINK_XP = etree.XPath(".//a[" + _HAS_CLASS.format("thread-link") + " and @href]")
+
+_SAFE_RE = re.compile(r"[^A-Za-z0-9_]+")
 
 
 # ---------- Utilities ----------
@@ -26,17 +51,23 @@ def load_classification_label():
         return default
 
 
-def setup_driver():
-    opts = Options()
-    opts.add_argument("--headless=new")
-    opts.add_argument("--disable-gpu")
-    opts.add_argument("--no-sandbox")
-    return webdriver.Chrome(options=opts)
+# Month-name table for the 'Aug 2023' timeline dates ("jan"/"january" → 1, ...)
+_MONTHS = {
+    name.casefold(): i
+    for i in range(1, 13)
+    for name in (calendar.month_abbr[i], calendar.month_name[i])
+}
 
 
 def parse_month_year(text):
     """Parse 'Aug 2023' or 'August 2023' → datetime(2023,8,1)."""
     text = (text or "").strip()
+    parts = text.split()
+    if len(parts) == 2 and len(parts[1]) == 4 and parts[1].isdigit():
+        month = _MONTHS.get(parts[0].casefold())
+        if month:
+            return datetime(int(parts[1]), month, 1)
+    # Anything else goes through strptime as before
     for fmt in ("%b %Y", "%B %Y"):
         try:
             return datetime.strptime(text, fmt)
@@ -45,64 +76,94 @@ def parse_month_year(text):
     return None
 
 
-def choose_best_date(fields):
+BEST_DATE_FIELDS = ["start_date", "award_date", "end_date", "record_timestamp"]
+RECORD_FIELDS = [
+    "project_id", "project_reference", "project_title", "funding_stream", "programme",
+    "programme_stream", "funding_and_awards_link",
+]
+
+
+def choose_best_dates(fields):
     """
     Prefer start_date, then award_date, then end_date, then record_timestamp.
-    Returns datetime or None.
+    Vectorised over a DataFrame of record fields; rows with no parseable date get NaT.
     """
-    candidates = [
-        fields.get("start_date"),
-        fields.get("award_date"),
-        fields.get("end_date"),
-        fields.get("record_timestamp"),
-    ]
-    for c in candidates:
-        if not c:
-            continue
-        # Try ISO date
-        try:
-            return datetime.strptime(c[:10], "%Y-%m-%d")
-        except Exception:
-            pass
-        # Try full ISO with timezone
-        try:
-            return datetime.fromisoformat(c.replace("Z", "+00:00"))
-        except Exception:
-            pass
-    return None
+    best = None
+    for col in BEST_DATE_FIELDS:
+        parsed = pd.to_datetime(fields[col].astype("string").str.slice(0, 10), format="%Y-%m-%d", errors="coerce")
+        best = parsed if best is None else best.combine_first(parsed)
+    return best
+
+
+def _first_filled(df, cols, default=""):
+    """Column-wise `a or b or c`: each row's first non-empty value among cols, else default."""
+    out = None
+    for col in cols:
+        vals = df[col].astype(object).mask(df[col].eq(""))
+        out = vals if out is None else out.where(out.notna(), vals)
+    return out.fillna(default) if default is not None else out
+
+
+def open_cache(path=CACHE_DB):
+    """Open (creating if needed) the SQLite page cache; safe to share across worker threads."""
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, html TEXT, fetched_at INTEGER)")
+    return conn
+
+
+_cache_lock = threading.Lock()
 
 
-def within_range(dt, start_dt, end_dt):
-    """Inclusive date range check; returns False if dt is None."""
-    if dt is None:
-        return False
-    return start_dt <= dt <= end_dt
+def cache_get(conn, url, ttl=CACHE_TTL):
+    """Return the cached HTML for a fresh award page, else None."""
+    with _cache_lock:
+        row = conn.execute(
+            "SELECT html FROM pages WHERE url = ? AND fetched_at > ?",
+            (url, int(time.time()) - ttl),
+        ).fetchone()
+    return row[0] if row else None
 
 
-def get_protocol_links_for_award(driver, project_url):
+def cache_put(conn, url, html):
+    with _cache_lock:
+        conn.execute(
+            "INSERT OR REPLACE INTO pages (url, html, fetched_at) VALUES (?, ?, ?)",
+            (url, html, int(time.time())),
+        )
+
+
+def get_protocol_links_for_award(session, project_url, cache=None):
     """
     Load award page; return a list of dicts with protocol links:
     [{'title': str, 'url': str, 'date': datetime or None}, ...]
-    Newest first.
+    Newest first. The timeline is server-rendered, so a plain GET is enough;
+    fresh pages are read from the cache instead.
     """
-    driver.get(project_url)
-    # Wait for timeline rows to appear, then fall back to short sleep
-    try:
-        WebDriverWait(driver, 6).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, ".thread-row"))
-        )
-    except Exception:
-        time.sleep(2)
+    html = cache_get(cache, project_url) if cache is not None else None
+    if html is None:
+        resp = session.get(project_url, timeout=15)
+        resp.raise_for_status()
+        html = resp.text
+        if cache is not None:
+            cache_put(cache, project_url, html)
+    return parse_protocol_links(html)
+
+
+def parse_protocol_links(html):
+    """Protocol links from the timeline rows of award page HTML, newest first."""
+    if not html or not html.strip():
+        return []
+    tree = lxml_html.fromstring(html)
 
-    soup = BeautifulSoup(driver.page_source, "html.parser")
     items = []
-    for row in soup.select(".thread-row"):
-        date_div = row.select_one(".thread-date-col")
-        date_text = date_div.get_text(strip=True) if date_div else None
-        a = row.select_one("a.thread-link[href]")
-        if not a:
+    for row in _THREAD_ROW_XP(tree):
+        date_divs = _THREAD_DATE_XP(row)
+        date_text = date_divs[0].text_content().strip() if date_divs else None
+        links = _THREAD_LINK_XP(row)
+        if not links:
             continue
-        link_text = a.get_text(strip=True)
+        a = links[0]
+        link_text = a.text_content().strip()
         href = a.get("href", "")
         if "protocol" in link_text.lower():
             items.append({
@@ -116,61 +177,86 @@ def get_protocol_links_for_award(driver, project_url):
 
 
 import concurrent.futures
-import threading
 
-def scrape_protocol_info_multithreaded(simplified_records, max_rows, num_threads=4):
+# Record columns a scrape worker reads, in the order it unpacks them
+SCRAPE_COLS = ["Award ID", "Project Title", "Funding Stream", "Project URL"]
+
+
+def protocol_row(aid, title, stream, url, protos):
+    """The scraped row for an award with protocols (protos is newest first)."""
+    newest = protos[0]
+    return {
+        "Award ID": aid,
+        "Project Title": title,
+        "Funding Stream": stream,
+        "Project URL": url,
+        "Protocol Count": len(protos),
+        "Most Recent Protocol URL": newest["url"],
+        "Most Recent Protocol Title": newest["title"],
+        "Most Recent Protocol Date": newest["date"].strftime("%Y-%m") if newest["date"] else ""
+    }
+
+
+class HitQuota:
+    """Protocol hits found so far across all workers; `stop` is set once max_rows is reached."""
+
+    def __init__(self, max_rows):
+        self.max_rows = max_rows
+        self.found = 0
+        self.stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def add(self):
+        with self._lock:
+            self.found += 1
+            if self.found >= self.max_rows:
+                self.stop.set()
+
+
+def scrape_chunk(subset, worker_id, quota, cache=None):
+    """Pool worker: scrapes one subset of records and returns its protocol rows."""
+    local_results = []
+    checked = 0
+    for aid, title, stream, url in subset[SCRAPE_COLS].itertuples(index=False, name=None):
+        if quota.stop.is_set():
+            break
+        checked += 1
+        print(f"🧵 Worker {worker_id}: ({checked}/{len(subset)}) Checking {aid}…")
+        if not aid or not url:
+            continue
+        try:
+            protos = get_protocol_links_for_award(SESSION, url, cache)
+        except Exception as e:
+            print(f"⚠️ Worker {worker_id} error on {aid}: {e}")
+            continue
+        if protos:
+            local_results.append(protocol_row(aid, title, stream, url, protos))
+            quota.add()
+    return local_results
+
+
+def scrape_protocol_info_multithreaded(records, max_rows, num_threads=4, cache=None):
     """
-    Scrapes protocol information using multiple concurrent Selenium instances.
-    Each thread handles its own webdriver and record subset.
+    Scrapes protocol information using multiple concurrent threads.
+    Each thread handles its own record subset over the shared HTTP session.
     """
-    lock = threading.Lock()
-    protocol_rows = []
-    total_records = len(simplified_records)
+    total_records = len(records)
     chunk_size = (total_records + num_threads - 1) // num_threads
 
     if total_records == 0:
         print('No records to return')
         return []
 
-    def worker(subset, worker_id):
-        driver = setup_driver()
-        local_results = []
-        checked = 0
-        for row in subset:
-            if len(protocol_rows) >= max_rows:
-                break
-            checked += 1
-            aid = row["Award ID"]
-            print(f"🧵 Worker {worker_id}: ({checked}/{len(subset)}) Checking {aid}…")
-            if not aid or not row["Project URL"]:
-                continue
-            try:
-                protos = get_protocol_links_for_award(driver, row["Project URL"])
-            except Exception as e:
-                print(f"⚠️ Worker {worker_id} error on {aid}: {e}")
-                continue
-            if protos:
-                newest = protos[0]
-                local_results.append({
-                    "Award ID": row["Award ID"],
-                    "Project Title": row["Project Title"],
-                    "Funding Stream": row["Funding Stream"],
-                    "Project URL": row["Project URL"],
-                    "Protocol Count": len(protos),
-                    "Most Recent Protocol URL": newest["url"],
-                    "Most Recent Protocol Title": newest["title"],
-                    "Most Recent Protocol Date": newest["date"].strftime("%Y-%m") if newest["date"] else ""
-                })
-        driver.quit()
-        with lock:
-            protocol_rows.extend(local_results)
-
     # Split work across threads
-    chunks = [simplified_records[i:i + chunk_size] for i in range(0, total_records, chunk_size)]
+    chunks = [records.iloc[i:i + chunk_size] for i in range(0, total_records, chunk_size)]
 
+    # Every worker stops as soon as the workers between them have found max_rows
+    quota = HitQuota(max_rows)
+    protocol_rows = []
     with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
-        futures = [executor.submit(worker, chunks[i], i+1) for i in range(len(chunks))]
-        concurrent.futures.wait(futures)
+        futures = [executor.submit(scrape_chunk, chunks[i], i + 1, quota, cache) for i in range(len(chunks))]
+        for future in futures:
+            protocol_rows.extend(future.result())
 
     print(f"✅ Multi-thread scrape complete. Total protocols found: {len(protocol_rows)}")
     return protocol_rows
@@ -178,33 +264,37 @@ def scrape_protocol_info_multithreaded(simplified_records, max_rows, num_threads
 
 
 
-def fetch_all_hits(query, page_size=100):
-    """Fetch all records for a query from NIHR OpenData (paginated)."""
+def fetch_all_hits(query, page_size=100, max_workers=8):
+    """Fetch all records for a query from NIHR OpenData (pages fetched concurrently)."""
     base_url = "https://nihr.opendatasoft.com/api/records/1.0/search/"
     dataset = "infonihr-open-dataset"
 
-    # First call to get total hits
-    head = requests.get(base_url, params={"dataset": dataset, "q": query, "rows": 0})
-    head.raise_for_status()
-    total = head.json().get("nhits", 0)
-
-    records, start = [], 0
-    while start < total:
+    def fetch_page(start):
         params = {"dataset": dataset, "q": query, "rows": page_size, "start": start}
-        resp = requests.get(base_url, params=params)
+        resp = SESSION.get(base_url, params=params)
         resp.raise_for_status()
-        chunk = resp.json().get("records", [])
-        if not chunk:
-            break
-        records.extend(chunk)
-        start += page_size
+        return resp.json()
+
+    # The first page carries nhits, so no separate rows=0 call is needed
+    first = fetch_page(0)
+    total = first.get("nhits", 0)
+    records = first.get("records", [])
+
+    # Remaining offsets are known now, so fetch them in parallel; map keeps offset order
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for page in pool.map(fetch_page, range(page_size, total, page_size)):
+            records.extend(page.get("records", []))
     return records, total
 
 
 # ---------- New Sub-Functions for run_search_to_excel ----------
 
 def get_filtered_api_records(search_term, start_date, end_date):
-    """Fetches all records and filters them by the specified date range."""
+    """
+    Fetches all records and filters them by the specified date range.
+    Returns one DataFrame (Award ID, Project Title, Funding Stream,
+    Project URL, _sort_date), newest first.
+    """
     # Parse cutoff dates
     start_dt = datetime.strptime(start_date, "%Y-%m-%d")
     end_dt = datetime.strptime(end_date, "%Y-%m-%d")
@@ -214,124 +304,108 @@ def get_filtered_api_records(search_term, start_date, end_date):
     all_records, nhits_total = fetch_all_hits(search_term)
     print(f"   API returned {nhits_total} total hits (before date filtering)")
 
-    simplified = []
-    for rec in all_records:
-        f = rec.get("fields", {})
-        award_id = f.get("project_id") or f.get("project_reference") or ""
-        title = f.get("project_title", "")
-        stream = f.get("funding_stream") or f.get("programme") or f.get("programme_stream") or ""
-        project_url = f.get("funding_and_awards_link") or f"https://fundingawards.nihr.ac.uk/award/{quote(award_id)}"
-        best = choose_best_date(f)
-        if within_range(best, start_dt, end_dt):
-            simplified.append({
-                "Award ID": award_id,
-                "Project Title": title,
-                "Funding Stream": stream,
-                "Project URL": project_url,
-                "_sort_date": best
-            })
+    # Date parsing, filtering and field fallbacks all vectorised in pandas
+    fields = pd.json_normalize([rec.get("fields", {}) for rec in all_records])
+    fields = fields.reindex(columns=fields.columns.union(BEST_DATE_FIELDS + RECORD_FIELDS))
+    best = choose_best_dates(fields)
+    in_window = best.between(start_dt, end_dt)
+    fields, best = fields.loc[in_window], best.loc[in_window]
+
+    award_id = _first_filled(fields, ["project_id", "project_reference"])
+    project_url = _first_filled(fields, ["funding_and_awards_link"], default=None)
+    records = pd.DataFrame({
+        "Award ID": award_id,
+        "Project Title": fields["project_title"].fillna(""),
+        "Funding Stream": _first_filled(fields, ["funding_stream", "programme", "programme_stream"]),
+        "Project URL": project_url.fillna("https://fundingawards.nihr.ac.uk/award/" + award_id.map(quote)),
+        "_sort_date": best,
+    })
 
-    print(f"   After date filter: {len(simplified)} records")
-    simplified.sort(key=lambda r: r["_sort_date"], reverse=True)
-    return simplified
+    # The API can return several rows per award; scrape each award page once
+    records = records.drop_duplicates("Project URL")
 
+    print(f"   After date filter: {len(records)} records")
+    return records.sort_values("_sort_date", ascending=False, kind="stable").reset_index(drop=True)
 
-def scrape_protocol_info(simplified_records, max_rows):
+
+def scrape_protocol_info(records, max_rows, cache=None):
     """Scrapes protocol information for a limited number of records."""
-    driver = setup_driver()
     protocol_rows = []
     checked = 0
 
-    for row in simplified_records:
+    for aid, title, stream, url in records[SCRAPE_COLS].itertuples(index=False, name=None):
         if len(protocol_rows) >= max_rows:
             break
         checked += 1
-        aid = row["Award ID"]
-        print(f"   ({checked}/{len(simplified_records)}) Checking protocols for {aid}…")
-        if not aid or not row["Project URL"]:
+        print(f"   ({checked}/{len(records)}) Checking protocols for {aid}…")
+        if not aid or not url:
             continue
 
         try:
-            protos = get_protocol_links_for_award(driver, row["Project URL"])
+            protos = get_protocol_links_for_award(SESSION, url, cache)
         except Exception as e:
             print(f"      ⚠️ Error scraping {aid}: {e}")
             continue
 
         if protos:
-            newest = protos[0]
-            protocol_rows.append({
-                "Award ID": row["Award ID"],
-                "Project Title": row["Project Title"],
-                "Funding Stream": row["Funding Stream"],
-                "Project URL": row["Project URL"],
-                "Protocol Count": len(protos),
-                "Most Recent Protocol URL": newest["url"],
-                "Most Recent Protocol Title": newest["title"],
-                "Most Recent Protocol Date": newest["date"].strftime("%Y-%m") if newest["date"] else ""
-            })
+            protocol_rows.append(protocol_row(aid, title, stream, url, protos))
 
-    driver.quit()
     return protocol_rows
 
 
-def scrape_protocol_info_driver_pool(simplified_records, max_rows, num_drivers=4):
-    task_queue = Queue()
-    results = []
-    results_lock = Lock()
-
-    # Populate queue
-    for rec in simplified_records:
-        task_queue.put(rec)
-
-    def worker(worker_id):
-        driver = setup_driver()
-        local_results = []
-        while not task_queue.empty() and len(results) < max_rows:
-            try:
-                row = task_queue.get_nowait()
-            except Exception:
-                break
-
-            aid = row["Award ID"]
-            print(f"🧵 Worker {worker_id} scraping {aid}")
-            try:
-                protos = get_protocol_links_for_award(driver, row["Project URL"])
-                if protos:
-                    newest = protos[0]
-                    local_results.append({
-                        "Award ID": row["Award ID"],
-                        "Project Title": row["Project Title"],
-                        "Funding Stream": row["Funding Stream"],
-                        "Project URL": row["Project URL"],
-                        "Protocol Count": len(protos),
-                        "Most Recent Protocol URL": newest["url"],
-                        "Most Recent Protocol Title": newest["title"],
-                        "Most Recent Protocol Date": newest["date"].strftime("%Y-%m") if newest["date"] else ""
-                    })
-            except Exception as e:
-                print(f"⚠️ Worker {worker_id} error on {aid}: {e}")
-            finally:
-                task_queue.task_done()
-
-        with results_lock:
-            results.extend(local_results)
-        driver.quit()
-
-    # Spin up driver pool
-    threads = []
-    for i in range(num_drivers):
-        t = Thread(target=worker, args=(i+1,))
-        t.start()
-        threads.append(t)
-
-    for t in threads:
-        t.join()
-
-    print(f"✅ Completed scraping with driver pool. {len(results)} protocols found.")
-    return results
-
-
-def write_excel_files(all_records, enriched_records, search_term, max_rows):
+# Fields read from the merged records, with the value used when a record lacks one
+RECORD_DEFAULTS = {
+    "Award ID": "", "Project Title": "", "Funding Stream": "", "Start Date": "", "End Date": "",
+    "Project URL": "", "Protocol Count": 0, "Most Recent Protocol URL": "",
+    "Most Recent Protocol Title": "", "Most Recent Protocol Date": "",
+    "Chief Investigators": "", "No. of PIs": 0, "Co-Investigators": "", "No. of Co-Is": 0,
+    "_sort_date": None,
+}
+
+
+# Columns a scrape worker adds for an award with protocols
+PROTOCOL_COLS = [
+    "Award ID", "Protocol Count", "Most Recent Protocol URL",
+    "Most Recent Protocol Title", "Most Recent Protocol Date",
+]
+
+
+def _records_frame(df):
+    """A records DataFrame with every RECORD_DEFAULTS column, gaps filled with the defaults."""
+    df = df.reindex(columns=list(RECORD_DEFAULTS))
+    fills = {k: v for k, v in RECORD_DEFAULTS.items() if v is not None}
+    counts = {k: int for k, v in RECORD_DEFAULTS.items() if v == 0}
+    return df.fillna(fills).infer_objects().astype(counts)
+
+
+def _hyperlinks(urls, label, keep_empty=False):
+    """=HYPERLINK formulas for a Series of URLs; blank URLs stay blank unless keep_empty."""
+    links = '=HYPERLINK("' + urls.astype(str) + '", "' + label + '")'
+    return links if keep_empty else links.where(urls.astype(bool), "")
+
+
+def write_sheet(writer, sheet_name, df, classification):
+    """
+    Write `df` to a new sheet row by row (constant_memory mode only accepts rows
+    in order), with the classification header/footer and autosized columns.
+    """
+    ws = writer.book.add_worksheet(sheet_name)
+    ws.set_header('&C' + classification)
+    ws.set_footer('&L' + classification + ' &R&P of &N')
+
+    # Autosize columns safely (longest cell per column measured in pandas)
+    for i, col in enumerate(df.columns):
+        longest = df[col].astype(str).str.len().max() if len(df) else 0
+        max_len = max(len(str(col)), int(longest)) + 2
+        ws.set_column(i, i, min(max_len, 80))
+
+    ws.write_row(0, 0, list(df.columns), writer.book.add_format({"bold": True, "border": 1}))
+    values = df.astype(object).where(df.notna(), "")
+    for r, row in enumerate(values.itertuples(index=False), start=1):
+        ws.write_row(r, 0, row)
+
+
+def write_excel_files(all_df, enriched_df, search_term, max_rows):
     """
     Writes 4 sheets, fully matching the original single-threaded version:
       1. All Checked
@@ -340,115 +414,79 @@ def write_excel_files(all_records, enriched_records, search_term, max_rows):
       4. Investigator Counts
     """
 
-    from collections import Counter
-
     # --- Sheet 1: All Checked (ALL filtered hits, regardless of protocols) ---
-    df_all = pd.DataFrame([
-        {
-            "Award ID": r.get("Award ID", ""),
-            "Project Title": r.get("Project Title", ""),
-            "Funding Stream": r.get("Funding Stream", ""),
-            "Start Date": r.get("Start Date", ""),
-            "End Date": r.get("End Date", ""),
-            "Project URL": f'=HYPERLINK("{r.get("Project URL", "")}", "Open")',
-            "Protocol Count": r.get("Protocol Count", 0),
-            "Most Recent Protocol": (
-                f'=HYPERLINK("{r["Most Recent Protocol URL"]}", "Protocol")'
-                if r.get("Most Recent Protocol URL") else ""
-            ),
-            "Most Recent Protocol Title": r.get("Most Recent Protocol Title", ""),
-            "Most Recent Protocol Date": r.get("Most Recent Protocol Date", ""),
-            "Sort Date": (
-                r["_sort_date"].strftime("%Y-%m-%d")
-                if isinstance(r.get("_sort_date"), datetime) else ""
-            )
-        }
-        for r in enriched_records or all_records  # fallback if no enrichment
-    ])
+    all_df = _records_frame(enriched_df if len(enriched_df) else all_df)  # fallback if no enrichment
+    df_all = pd.DataFrame({
+        "Award ID": all_df["Award ID"],
+        "Project Title": all_df["Project Title"],
+        "Funding Stream": all_df["Funding Stream"],
+        "Start Date": all_df["Start Date"],
+        "End Date": all_df["End Date"],
+        "Project URL": _hyperlinks(all_df["Project URL"], "Open", keep_empty=True),
+        "Protocol Count": all_df["Protocol Count"],
+        "Most Recent Protocol": _hyperlinks(all_df["Most Recent Protocol URL"], "Protocol"),
+        "Most Recent Protocol Title": all_df["Most Recent Protocol Title"],
+        "Most Recent Protocol Date": all_df["Most Recent Protocol Date"],
+        "Sort Date": pd.to_datetime(all_df["_sort_date"], errors="coerce").dt.strftime("%Y-%m-%d").fillna(""),
+    })
 
     # --- Sheet 2: Has Protocol Attachments (subset with ≥1 protocol) ---
-    with_protocol = [r for r in enriched_records if r.get("Protocol Count", 0) > 0]
-    df_with = pd.DataFrame([
-        {
-            "Award ID": r.get("Award ID", ""),
-            "Project Title": r.get("Project Title", ""),
-            "Funding Stream": r.get("Funding Stream", ""),
-            "Start Date": r.get("Start Date", ""),
-            "End Date": r.get("End Date", ""),
-            "Project URL": f'=HYPERLINK("{r.get("Project URL", "")}", "Open")',
-            "Protocol Count": r.get("Protocol Count", 0),
-            "Most Recent Protocol": (
-                f'=HYPERLINK("{r["Most Recent Protocol URL"]}", "Protocol")'
-                if r.get("Most Recent Protocol URL") else ""
-            ),
-            "Most Recent Protocol Title": r.get("Most Recent Protocol Title", ""),
-            "Most Recent Protocol Date": r.get("Most Recent Protocol Date", "")
-        }
-        for r in with_protocol[:max_rows]
-    ])
+    enriched_df = _records_frame(enriched_df)
+    with_protocol = enriched_df.loc[enriched_df["Protocol Count"] > 0].head(max_rows)
+    df_with = pd.DataFrame({
+        "Award ID": with_protocol["Award ID"],
+        "Project Title": with_protocol["Project Title"],
+        "Funding Stream": with_protocol["Funding Stream"],
+        "Start Date": with_protocol["Start Date"],
+        "End Date": with_protocol["End Date"],
+        "Project URL": _hyperlinks(with_protocol["Project URL"], "Open", keep_empty=True),
+        "Protocol Count": with_protocol["Protocol Count"],
+        "Most Recent Protocol": _hyperlinks(with_protocol["Most Recent Protocol URL"], "Protocol"),
+        "Most Recent Protocol Title": with_protocol["Most Recent Protocol Title"],
+        "Most Recent Protocol Date": with_protocol["Most Recent Protocol Date"],
+    })
 
     # --- Sheet 3: PI and Co-I Summary (for ALL records) ---
-    df_people = pd.DataFrame([
-        {
-            "Award ID": r.get("Award ID", ""),
-            "Project Title": r.get("Project Title", ""),
-            "Funding Stream": r.get("Funding Stream", ""),
-            "Project URL": f'=HYPERLINK("{r.get("Project URL", "")}", "Open")',
-            "Chief Investigators": r.get("Chief Investigators", ""),
-            "No. of PIs": r.get("No. of PIs", 0),
-            "Co-Investigators": r.get("Co-Investigators", ""),
-            "No. of Co-Is": r.get("No. of Co-Is", 0),
-        }
-        for r in enriched_records
-    ])
+    df_people = pd.DataFrame({
+        "Award ID": enriched_df["Award ID"],
+        "Project Title": enriched_df["Project Title"],
+        "Funding Stream": enriched_df["Funding Stream"],
+        "Project URL": _hyperlinks(enriched_df["Project URL"], "Open", keep_empty=True),
+        "Chief Investigators": enriched_df["Chief Investigators"],
+        "No. of PIs": enriched_df["No. of PIs"],
+        "Co-Investigators": enriched_df["Co-Investigators"],
+        "No. of Co-Is": enriched_df["No. of Co-Is"],
+    })
 
     # --- Sheet 4: Investigator Counts (name frequency) ---
-    all_names = []
-    for r in enriched_records:
-        if r.get("Chief Investigators"):
-            all_names.extend([n.strip() for n in r["Chief Investigators"].split(";") if n.strip()])
-        if r.get("Co-Investigators"):
-            all_names.extend([n.strip() for n in r["Co-Investigators"].split(";") if n.strip()])
-
-    from collections import Counter
-    counts = Counter(all_names)
+    # Counter consumes the names straight from a generator; no intermediate list
+    counts = Counter(
+        name.strip()
+        for names in chain(enriched_df["Chief Investigators"], enriched_df["Co-Investigators"])
+        for name in (names or "").split(";")
+        if name.strip()
+    )
     df_counts = pd.DataFrame(
         sorted(counts.items(), key=lambda x: x[1], reverse=True),
         columns=["Investigator Name", "Total Count"]
     )
 
     # --- Save file ---
-    safe_term = re.sub(r"[^A-Za-z0-9_]+", "_", search_term).strip("_")
+    safe_term = _SAFE_RE.sub("_", search_term).strip("_")
     today = datetime.now().strftime("%Y%m%d")
     outfile = f"nihr_protocol_search_{safe_term}_{today}.xlsx"
     classification = load_classification_label()
 
-    # --- Write Excel ---
-    with pd.ExcelWriter(outfile, engine="xlsxwriter") as writer:
-        df_all.to_excel(writer, index=False, sheet_name="All Checked")
-        df_with.to_excel(writer, index=False, sheet_name="Has Protocol Attachments")
-        df_people.to_excel(writer, index=False, sheet_name="PI and Co-I Summary")
-        df_counts.to_excel(writer, index=False, sheet_name="Investigator Counts")
-
-        wb = writer.book
-
-        # Apply header/footer + column autosizing
+    # --- Write Excel (constant_memory: each row is flushed to disk as it is written) ---
+    with pd.ExcelWriter(outfile, engine="xlsxwriter",
+                        engine_kwargs={"options": {"constant_memory": True}}) as writer:
         for sheet_name, df_curr in [
             ("All Checked", df_all),
             ("Has Protocol Attachments", df_with),
             ("PI and Co-I Summary", df_people),
             ("Investigator Counts", df_counts),
         ]:
-            ws = writer.sheets[sheet_name]
-            ws.set_header('&C' + classification)
-            ws.set_footer('&L' + classification + ' &R&P of &N')
-
-            # Autosize columns safely
-            for i, col in enumerate(df_curr.columns):
-                col_vals = df_curr[col].tolist()
-                # Convert everything to string before measuring length
-                max_len = max([len(str(col))] + [len(str(v)) for v in col_vals]) + 2
-                ws.set_column(i, i, min(max_len, 80))
+            write_sheet(writer, sheet_name, df_curr, classification)
 
     print(f"✅ Excel complete.")
     print(f"🧾 Sheets written:")
@@ -462,44 +500,36 @@ def write_excel_files(all_records, enriched_records, search_term, max_rows):
 # ---------- Main ----------
 
 
-def run_search_to_excel(search_term, start_date, end_date, max_rows):
+def run_search_to_excel(search_term, start_date, end_date, max_rows, use_cache=True):
     """
     Hard date cut-offs; two-sheet Excel:
       - 'All Checked': ALL filtered hits (no protocol requirement)
       - 'Has Protocol Attachments': up to max_rows that have ≥1 protocol
     Stops when either max_rows reached OR filtered list exhausted.
+    Award pages are cached on disk for CACHE_TTL; use_cache=False bypasses the cache.
     Saves to current directory.
     """
-    # Step 1: Fetch and filter API records
-    all_records = get_filtered_api_records(search_term, start_date, end_date)
+    # Step 1: Fetch and filter API records (one DataFrame from here on)
+    all_df = get_filtered_api_records(search_term, start_date, end_date)
 
     # Step 2: Scrape for protocol information
-    # protocol_records = scrape_protocol_info(all_records, max_rows)
+    # protocol_records = scrape_protocol_info(all_df, max_rows)
 
     # with multi threading
-    protocol_records = scrape_protocol_info_multithreaded(all_records, max_rows)
-
-    # --- Merge protocol info back into full record list ---
-    enriched_records = []
-    protocol_index = {r["Award ID"]: r for r in protocol_records}
-
-    for rec in all_records:
-        aid = rec.get("Award ID")
-        p = protocol_index.get(aid, {})
-        enriched_records.append({
-            **rec,
-            "Protocol Count": p.get("Protocol Count", 0),
-            "Most Recent Protocol URL": p.get("Most Recent Protocol URL", ""),
-            "Most Recent Protocol Title": p.get("Most Recent Protocol Title",
-                                                ""),
-            "Most Recent Protocol Date": p.get("Most Recent Protocol Date", ""),
-            "Chief Investigators": p.get("Chief Investigators", ""),
-            "No. of PIs": p.get("No. of PIs", 0),
-            "Co-Investigators": p.get("Co-Investigators", ""),
-            "No. of Co-Is": p.get("No. of Co-Is", 0),
-        })
-
-    write_excel_files(all_records, enriched_records, search_term, max_rows)
+    cache = open_cache() if use_cache else None
+    try:
+        protocol_records = scrape_protocol_info_multithreaded(all_df, max_rows, cache=cache)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    # --- Merge protocol info back into full record list (left join on Award ID) ---
+    proto_df = pd.DataFrame.from_records(protocol_records, columns=PROTOCOL_COLS)
+    # Last row wins for a repeated award, as the old dict index did
+    proto_df = proto_df.drop_duplicates("Award ID", keep="last")
+    enriched_df = all_df.merge(proto_df, on="Award ID", how="left")
+
+    write_excel_files(all_df, enriched_df, search_term, max_rows)
 
 
 # ---------- Example usage ----------